@@ -14,12 +14,16 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'
 
 # Import our modules
 from scripts.processor import process_all_products
+from scripts.scraper import get_run_summary
 from scripts.visualizer import generate_all_charts
 
 # Define base directory
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SCRIPTS_DIR = os.path.join(BASE_DIR, 'scripts')
 
+# Nombre de pages récupérées simultanément par la tâche track_prices
+MAX_CONCURRENCY = int(os.environ.get('PRICE_TRACKER_MAX_CONCURRENCY', '8'))
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -52,12 +56,31 @@ dag = DAG(
 def track_prices(**kwargs):
     """Suivi des prix pour tous les produits"""
     logger.info("Démarrage du processus de suivi des prix")
-    results = process_all_products()
+    results = process_all_products(max_concurrency=MAX_CONCURRENCY)
     if results:
         success_count = sum(1 for r in results if r['price'] is not None)
         logger.info(f"Suivi des prix réussi pour {success_count}/{len(results)} produits")
         # Pousse les résultats vers XCom pour les tâches en aval
         kwargs['ti'].xcom_push(key='price_tracking_results', value=results)
+    
+    # Résumé de l'exécution: statuts des produits et état des disjoncteurs par domaine
+    summary = get_run_summary()
+    summary['statuses'] = {}
+    for r in results or []:
+        status = r.get('status') or 'unknown'
+        summary['statuses'][status] = summary['statuses'].get(status, 0) + 1
+    open_circuits = [d for d, state in summary['circuit_breakers'].items() if state['state'] != 'closed']
+    if open_circuits:
+        logger.warning(f"Disjoncteurs ouverts: {', '.join(open_circuits)}")
+    drifting = [f"{site}.{field} ({stats['recent_hit_rate']:.0%})"
+                for site, fields in summary['selectors'].items()
+                for field, stats in fields.items() if stats['drift']]
+    if drifting:
+        logger.warning(f"Sélecteurs en dérive: {', '.join(drifting)}")
+    scan_mismatches = [site for site, counts in summary['scan'].items() if counts.get('mismatch')]
+    if scan_mismatches:
+        logger.warning(f"Lecture directe du HTML différente du DOM: {', '.join(scan_mismatches)}")
+    kwargs['ti'].xcom_push(key='run_summary', value=summary)
     return results
 
 def generate_visualizations(**kwargs):
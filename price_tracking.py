@@ -71,9 +71,11 @@ def add_product():
     product_name = input("Nom du produit: ")
     product_url = input("URL du produit: ")
     
-    # Générer un ID unique pour le produit
+    # Générer un ID unique pour le produit, à partir de l'URL canonique (sans paramètres de suivi)
     import hashlib
-    product_id = hashlib.md5(product_url.encode()).hexdigest()[:8]
+    from scripts.urls import canonical_url
+    canonical = canonical_url(product_url)
+    product_id = hashlib.md5(canonical.encode()).hexdigest()[:8]
     
     # Demander le sélecteur CSS pour le prix
     print("\nSélecteur CSS pour le prix:")
@@ -112,7 +114,10 @@ def add_product():
     # Vérifier si le produit existe déjà
     product_exists = False
     for i, product in enumerate(products):
-        if product["id"] == product_id or product["url"] == product_url:
+        if product["id"] == product_id or canonical_url(product["url"]) == canonical:
+            # Garder l'ID existant: l'historique (prices.csv, products.csv) y est rattaché
+            product_id = product["id"]
+            new_product["id"] = product_id
             products[i] = new_product
             product_exists = True
             print(f"\nProduit '{product_name}' mis à jour avec succès!")
@@ -152,7 +157,8 @@ def process_product(product_id=None):
         if product:
             print(f"Traitement du produit: {product['name']}")
             from scripts.processor import process_product
-            result = process_product(product)
+            # Vérification interactive: réponse immédiate depuis le cache, même expiré
+            result = process_product(product, mode='swr')
             if result is not None:
                 print(f"Prix actuel: {result}")
             else:
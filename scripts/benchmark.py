@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Mesures de performance du scraper sur les pages présentes dans le cache.
+
+Utilisation:
+    python scripts/benchmark.py parsers [--repeat N]
+    python scripts/benchmark.py extraction [--repeat N]
+    python scripts/benchmark.py scopes [--repeat N]
+    python scripts/benchmark.py replay [--products N] [--target get_price|bulk|process_all] [--latency MS]
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from urllib.parse import urlsplit
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Ajoute le répertoire parent au sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.cache import CACHE_DIR, PageCache
+from scripts.ecommerce_parser import EcommerceParser
+from scripts.html_backends import make_document
+from scripts.sites import site_registry
+from scripts.bot_detection import detect_block_page
+from scripts.replay import FixtureStore, ReplayServer, seed_from_cache, FIXTURES_DIR
+
+
+def load_cached_pages(cache_dir=CACHE_DIR):
+    """
+    Charge les pages HTML du cache avec l'URL correspondante.
+    Les anciens fichiers domaine_hash.html n'ont pas d'URL complète: le domaine tiré
+    du nom de fichier suffit à la détection du site.
+
+    Returns:
+        list: Tuples (nom, url, html)
+    """
+    pages = []
+    for path in sorted(glob.glob(os.path.join(cache_dir, '*.html'))):
+        name = os.path.basename(path)
+        domain = name.rsplit('_', 1)[0]
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            pages.append((name, f"https://{domain}/", f.read()))
+
+    index_file = os.path.join(cache_dir, PageCache.INDEX_NAME)
+    if os.path.exists(index_file):
+        with open(index_file, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        for key, entry in sorted(index.items()):
+            path = os.path.join(cache_dir, PageCache.PAGES_NAME, f"{key}.html")
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    pages.append((key[:12], entry['url'], f.read()))
+    return pages
+
+
+def time_call(func, repeat):
+    """Exécute func repeat fois et retourne (dernier résultat, durée moyenne en ms)."""
+    result = None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) * 1000 / repeat
+
+
+def benchmark_parsers(pages, repeat=5):
+    """Compare les backends d'analyse html.parser et lxml sur chaque page."""
+    backends = ('html.parser', 'lxml')
+    print(f"{'page':<45} {'taille':>10} " + " ".join(f"{b:>12}" for b in backends) + "  identiques")
+    totals = dict.fromkeys(backends, 0.0)
+    for name, url, html in pages:
+        results = {}
+        timings = {}
+        for backend in backends:
+            results[backend], timings[backend] = time_call(
+                lambda: EcommerceParser.parse_dom(html, url, backend=backend, scoped=False), repeat)
+            totals[backend] += timings[backend]
+        identical = all(results[b][key] == results[backends[0]][key]
+                        for b in backends for key in results[b] if key != 'template')
+        print(f"{name[:45]:<45} {len(html):>10} "
+              + " ".join(f"{timings[b]:>10.1f}ms" for b in backends)
+              + f"  {'oui' if identical else 'NON'}")
+    print(f"{'total':<45} {'':>10} " + " ".join(f"{totals[b]:>10.1f}ms" for b in backends))
+
+
+def sequential_extract(document, site):
+    """Extraction historique: un select_one par sélecteur, champ après champ."""
+    selectors = EcommerceParser.get_selectors(site)
+    values = {}
+    for field in ("price", "title", "availability"):
+        values[field] = EcommerceParser.extract_data(document, selectors, field)
+    values["image"] = None
+    for selector in selectors.get("image", []):
+        element = document.select_one(selector)
+        if element and element.has_attr('src'):
+            values["image"] = element['src']
+            break
+    return values
+
+
+def single_pass_extract(document, site):
+    """Extraction en un seul parcours avec FieldExtractor."""
+    matches = EcommerceParser.get_extractor(site).extract(document)
+    values = {}
+    for field in ("price", "title", "availability"):
+        values[field] = matches[field][1].get_text(strip=True) if matches.get(field) else None
+    values["image"] = matches["image"][1]['src'] if matches.get("image") else None
+    return values
+
+
+def benchmark_extraction(pages, repeat=5):
+    """Compare, sur un document déjà analysé, l'extraction champ par champ et l'extraction en un seul parcours."""
+    print(f"{'page':<45} {'backend':>12} {'avant':>10} {'après':>10}  identiques")
+    for name, url, html in pages:
+        site = EcommerceParser.detect_site(url)
+        for backend in ('html.parser', 'lxml'):
+            document = make_document(html, backend)
+            before, before_ms = time_call(lambda: sequential_extract(document, site), repeat)
+            after, after_ms = time_call(lambda: single_pass_extract(document, site), repeat)
+            print(f"{name[:45]:<45} {backend:>12} {before_ms:>8.2f}ms {after_ms:>8.2f}ms  "
+                  f"{'oui' if before == after else 'NON'}")
+
+
+def traced_peak_mb(func):
+    """Pic des allocations Python (tracemalloc) pendant func(), en Mo."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_scopes(pages, repeat=5):
+    """
+    Compare, avec html.parser, l'analyse de la page entière et l'analyse restreinte aux
+    conteneurs du site (parse_scope): durée de construction de l'arbre, pic mémoire et résultats.
+    """
+    print(f"{'page':<45} {'conteneurs':<30} {'complet':>10} {'restreint':>10} {'mém. complet':>13} "
+          f"{'mém. restreint':>15}  identiques")
+    for name, url, html in pages:
+        profile = site_registry.for_url(url)
+        if not profile.parse_scope:
+            continue
+        _, full_ms = time_call(lambda: make_document(html, 'html.parser'), repeat)
+        _, scoped_ms = time_call(lambda: make_document(html, 'html.parser', profile.parse_scope), repeat)
+        full_mb = traced_peak_mb(lambda: make_document(html, 'html.parser'))
+        scoped_mb = traced_peak_mb(lambda: make_document(html, 'html.parser', profile.parse_scope))
+        full = EcommerceParser.parse_dom(html, url, scoped=False)
+        scoped = EcommerceParser.parse_dom(html, url)
+        identical = all(full[key] == scoped[key] for key in full if key != 'template')
+        print(f"{name[:45]:<45} {','.join(sorted(profile.parse_scope))[:30]:<30} {full_ms:>8.1f}ms {scoped_ms:>8.1f}ms "
+              f"{full_mb:>10.1f} Mo {scoped_mb:>12.1f} Mo  {'oui' if identical else 'NON'}")
+
+
+def peak_memory_mb():
+    """Pic de mémoire résidente du processus en Mo, ou None si indisponible (Windows)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilo-octets sous Linux, octets sous macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def replay_products(store, count, include_blocked=False):
+    """
+    Construit count produits servis par le serveur de rejeu, en parcourant les fixtures
+    en boucle. Chaque produit a sa propre URL (/replay/<clé>/<n>) sur l'hôte d'origine,
+    pour que la détection du site fonctionne et que chaque produit soit une page distincte.
+    """
+    fixtures = []
+    for key, meta in store.entries():
+        if meta['status'] != 200:
+            continue
+        if not include_blocked:
+            _, body = store.load(key)
+            if detect_block_page(body):
+                continue
+        fixtures.append((key, meta))
+    products = []
+    for index in range(count if fixtures else 0):
+        key, meta = fixtures[index % len(fixtures)]
+        host = urlsplit(meta['url']).netloc
+        products.append({
+            'id': f"bench{index}",
+            'name': f"Produit {index}",
+            'url': f"http://{host}/replay/{key}/{index}",
+            'css_selector': 'auto',
+            'notify_on_drop': False,
+        })
+    return products
+
+
+def cpu_time():
+    """Temps CPU du processus et de ses processus fils terminés (pool d'analyse)."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def benchmark_replay(args):
+    """
+    Mesure le débit du scraper contre le serveur de rejeu local: produits par seconde,
+    temps CPU et pic mémoire. Les données (cache, CSV, rapports) vont dans un répertoire temporaire.
+    """
+    store = FixtureStore(args.fixtures)
+    if args.seed or not store.entries():
+        print(f"{seed_from_cache(store)} pages du cache importées dans {store.directory}")
+    products = replay_products(store, args.products, include_blocked=args.include_blocked)
+    if not products:
+        print(f"Aucune fixture utilisable dans {store.directory}")
+        return 1
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+    from scripts import ecommerce_parser, scraper, processor, save_price
+    from scripts.cache import PageCache, NegativeCache
+    from scripts.selector_stats import SelectorStats
+    from scripts.templates import TemplateCache
+
+    server = ReplayServer(store, latency=args.latency / 1000, jitter=args.jitter / 1000,
+                          rate_limit=args.rate_limit, error_rate=args.error_rate).start()
+    previous_proxy = {name: os.environ.get(name) for name in ('HTTP_PROXY', 'http_proxy')}
+    with tempfile.TemporaryDirectory(prefix='price_tracker_bench_') as tmp:
+        # Redirige toutes les données écrites par le scraper et le processor
+        data_dir = os.path.join(tmp, 'data')
+        os.makedirs(data_dir)
+        scraper.page_cache = PageCache(os.path.join(tmp, 'cache'))
+        scraper.negative_cache = processor.negative_cache = NegativeCache(os.path.join(tmp, 'cache'))
+        scraper.selector_stats = ecommerce_parser.selector_stats = SelectorStats(os.path.join(tmp, 'cache'))
+        scraper.template_cache = ecommerce_parser.template_cache = TemplateCache(os.path.join(tmp, 'cache'))
+        processor.BASE_DIR = tmp
+        processor.PRODUCTS_JSON = os.path.join(data_dir, 'products.json')
+        processor.PRICES_CSV = save_price.PRICES_CSV = os.path.join(data_dir, 'prices.csv')
+        processor.PRODUCTS_CSV = save_price.PRODUCTS_CSV = os.path.join(data_dir, 'products.csv')
+        save_price.DATA_DIR = data_dir
+        with open(processor.PRODUCTS_JSON, 'w', encoding='utf-8') as f:
+            json.dump(products, f)
+        # Le débit par domaine est celui imposé par le serveur de rejeu, pas celui de production
+        scraper.rate_limiter.rate = args.scraper_rate
+        scraper.rate_limiter.burst = max(1, int(args.scraper_rate))
+        scraper.rate_limiter.limits.clear()
+        if args.parse_workers:
+            scraper.DEFAULT_PARSE_WORKERS = args.parse_workers
+        for name in previous_proxy:
+            os.environ[name] = server.address
+
+        try:
+            cpu_start = cpu_time()
+            start = time.perf_counter()
+            if args.target == 'get_price':
+                results = [scraper.get_price(p['url'], p['css_selector']) for p in products]
+            elif args.target == 'bulk':
+                results = scraper.get_prices_bulk(products, max_concurrency=args.concurrency)
+            else:
+                results = processor.process_all_products(max_concurrency=args.concurrency)
+            elapsed = time.perf_counter() - start
+            cpu = cpu_time() - cpu_start
+        finally:
+            server.stop()
+            for name, value in previous_proxy.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+            logging.disable(logging.NOTSET)
+
+    statuses = {}
+    for result in results or []:
+        statuses[result.get('status')] = statuses.get(result.get('status'), 0) + 1
+    memory = peak_memory_mb()
+    print(f"cible:            {args.target}")
+    print(f"produits:         {len(products)} ({len(set(p['url'].split('/replay/')[1][:64] for p in products))} fixtures)")
+    print(f"durée:            {elapsed:.2f} s")
+    print(f"débit:            {len(products) / elapsed:.1f} produits/s")
+    print(f"CPU:              {cpu:.2f} s ({100 * cpu / elapsed:.0f} % d'un cœur)")
+    print(f"mémoire (pic):    {f'{memory:.0f} Mo' if memory is not None else 'indisponible'}")
+    print(f"statuts:          {statuses}")
+    print(f"serveur:          {server.stats}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks du scraper sur les pages en cache')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parsers_cmd = subparsers.add_parser('parsers', help="Compare les backends d'analyse HTML")
+    parsers_cmd.add_argument('--repeat', '-n', type=int, default=5, help='Nombre de répétitions par page')
+
+    extraction_cmd = subparsers.add_parser('extraction', help="Compare l'extraction champ par champ et en un seul parcours")
+    extraction_cmd.add_argument('--repeat', '-n', type=int, default=5, help='Nombre de répétitions par page')
+
+    scopes_cmd = subparsers.add_parser('scopes', help="Compare l'analyse complète et l'analyse restreinte aux conteneurs")
+    scopes_cmd.add_argument('--repeat', '-n', type=int, default=5, help='Nombre de répétitions par page')
+
+    replay_cmd = subparsers.add_parser('replay', help='Mesure le débit du scraper contre le serveur de rejeu local')
+    replay_cmd.add_argument('--products', '-n', type=int, default=100, help='Nombre de produits')
+    replay_cmd.add_argument('--target', choices=('get_price', 'bulk', 'process_all'), default='process_all',
+                            help='get_price (séquentiel), bulk (get_prices_bulk) ou process_all (process_all_products)')
+    replay_cmd.add_argument('--concurrency', type=int, default=8, help='Requêtes simultanées (bulk, process_all)')
+    replay_cmd.add_argument('--parse-workers', type=int, default=None,
+                            help="Processus d'analyse HTML (bulk, process_all; 1 = analyse dans les threads)")
+    replay_cmd.add_argument('--fixtures', default=FIXTURES_DIR, help='Répertoire des fixtures')
+    replay_cmd.add_argument('--seed', action='store_true', help='Importe les pages du cache avant la mesure')
+    replay_cmd.add_argument('--include-blocked', action='store_true', help='Garde les fixtures de pages de blocage')
+    replay_cmd.add_argument('--latency', type=float, default=50.0, help='Latence du serveur, en millisecondes')
+    replay_cmd.add_argument('--jitter', type=float, default=10.0, help='Variation de latence, en millisecondes')
+    replay_cmd.add_argument('--rate-limit', type=float, default=None, help='Requêtes/s par hôte avant 429')
+    replay_cmd.add_argument('--error-rate', type=float, default=0.0, help="Proportion d'erreurs injectées")
+    replay_cmd.add_argument('--scraper-rate', type=float, default=1000.0,
+                            help='Débit maximal du scraper par domaine pendant la mesure (requêtes/s)')
+    replay_cmd.add_argument('--verbose', '-v', action='store_true', help='Affiche les logs du scraper')
+
+    args = parser.parse_args()
+    if args.command == 'replay':
+        return benchmark_replay(args)
+
+    pages = load_cached_pages()
+    if not pages:
+        print(f"Aucune page trouvée dans {CACHE_DIR}")
+        return 1
+
+    if args.command == 'parsers':
+        benchmark_parsers(pages, repeat=args.repeat)
+    elif args.command == 'extraction':
+        benchmark_extraction(pages, repeat=args.repeat)
+    elif args.command == 'scopes':
+        benchmark_scopes(pages, repeat=args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Détection des pages de blocage anti-robot (captcha, challenge, accès refusé).
+Ces pages ne contiennent jamais de prix: les reconnaître avant l'analyse évite de les
+mettre en cache, de les analyser et de gaspiller les réessais sur un domaine qui nous bloque.
+La classification ne regarde que la taille, quelques marqueurs et le titre: un statut
+429, 503 ou 403 seul signale une surcharge ou une limite de débit, gérée par la régulation
+adaptative du scraper (AIMD et Retry-After), et n'est une page de blocage que si son
+contenu l'indique. Les widgets captcha génériques (reCAPTCHA, hCaptcha) apparaissent
+aussi dans des pages produit (formulaire d'avis, connexion): ils ne désignent une page
+de blocage que si la page ne présente aucun signe de page produit.
+"""
+import re
+
+# Au-delà de cette taille, une page est considérée comme une vraie page produit
+MAX_BLOCK_PAGE_SIZE = 150 * 1024
+
+# Marqueurs présents dans les pages de blocage connues, avec le motif à rapporter
+BLOCK_MARKERS = (
+    (b'/errors/validateCaptcha', 'captcha amazon'),
+    (b'opfcaptcha', 'captcha amazon'),
+    (b'api-services-support@amazon.com', 'robot amazon'),
+    (b'captcha-delivery.com', 'captcha datadome'),
+    (b'cf-chl-', 'challenge cloudflare'),
+    (b'cf-browser-verification', 'challenge cloudflare'),
+    (b'_Incapsula_Resource', 'blocage incapsula'),
+    (b'px-captcha', 'captcha perimeterx'),
+)
+
+# Widgets captcha intégrables dans n'importe quelle page, retenus seulement sans signe de page produit
+CAPTCHA_WIDGET_MARKERS = (
+    (b'g-recaptcha', 'recaptcha'),
+    (b'hcaptcha.com', 'hcaptcha'),
+)
+
+# Signes d'une page produit: données structurées, métadonnées de prix, bouton d'achat
+PRODUCT_MARKERS = (
+    b'itemprop="price"',
+    b'"@type":"Product"',
+    b'"@type": "Product"',
+    b'product:price:amount',
+    b'og:price:amount',
+    b'add-to-cart',
+    b'addToCart',
+    b'a-offscreen',
+)
+
+# Titres de pages de blocage (comparés en minuscules)
+BLOCK_TITLES = (
+    'robot check',
+    'attention required!',
+    'just a moment...',
+    'access denied',
+    'accès refusé',
+    'pardon our interruption',
+    'are you a robot?',
+    'êtes-vous un robot ?',
+    'captcha',
+)
+
+_TITLE_RE = re.compile(rb'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+
+
+def detect_block_page(content, status_code=200):
+    """
+    Détermine si une réponse est une page de blocage anti-robot.
+
+    Args:
+        content (str|bytes): Corps de la réponse
+        status_code (int): Statut HTTP de la réponse, repris dans le motif s'il s'agit d'une erreur
+
+    Returns:
+        str: Motif du blocage, ou None si la page semble être une page normale
+    """
+    reason = _block_reason(content)
+    if reason and status_code >= 400:
+        return f"{reason}, statut HTTP {status_code}"
+    return reason
+
+
+def _block_reason(content):
+    if content is None:
+        return None
+    if isinstance(content, str):
+        content = content.encode('utf-8', errors='replace')
+    if len(content) > MAX_BLOCK_PAGE_SIZE:
+        return None
+
+    for marker, reason in BLOCK_MARKERS:
+        if marker in content:
+            return reason
+    for marker, reason in CAPTCHA_WIDGET_MARKERS:
+        if marker in content and not any(signal in content for signal in PRODUCT_MARKERS):
+            return reason
+
+    title_match = _TITLE_RE.search(content)
+    if title_match:
+        title = title_match.group(1).decode('utf-8', errors='replace').strip().lower()
+        for block_title in BLOCK_TITLES:
+            if title.startswith(block_title):
+                return f"titre '{title}'"
+    return None
@@ -0,0 +1,642 @@
+"""
+Cache disque des pages récupérées par le scraper.
+Chaque page est stockée sous une clé stable (SHA-256 de l'URL canonique, voir scripts.urls),
+partagée entre le worker Airflow, la ligne de commande et le tableau de bord. Un fichier d'index
+conserve la date de récupération, la taille et les validateurs HTTP de chaque entrée,
+et l'éviction se fait par âge (TTL) puis par taille totale (LRU).
+Chaque modification est ajoutée à un journal (index.journal), visible aussitôt par les autres
+processus; l'index complet n'est réécrit que par lots (au plus une fois par flush_interval
+et par flush), pour que le coût d'une écriture ne dépende pas de la taille du cache.
+
+L'index sert aussi de second niveau de cache: il garde les résultats d'extraction
+de chaque page par sélecteur et version du parser, ce qui évite de ré-analyser le HTML.
+"""
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from scripts.urls import canonical_url
+
+logger = logging.getLogger('page_cache')
+
+# Définition des chemins
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+
+# Limites par défaut du cache
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024  # 200 Mo
+DEFAULT_MAX_AGE = 7 * 24 * 3600  # 7 jours
+
+# Champs d'un résultat d'extraction conservés dans l'index (ceux que lit le scraper);
+# les détails d'analyse (sélecteurs gagnants, template, scan) ne sont pas persistés
+EXTRACTION_FIELDS = ('price_text', 'numeric_price', 'currency', 'title', 'availability', 'image_url', 'site')
+
+
+def cache_key(url):
+    """Clé de cache stable entre processus: SHA-256 de l'URL canonique."""
+    return hashlib.sha256(canonical_url(url).encode('utf-8')).hexdigest()
+
+
+class FileLock:
+    """
+    Verrou inter-processus reposant sur la création exclusive d'un fichier
+    (os.O_CREAT | os.O_EXCL), qui fonctionne aussi sous Windows.
+    Un verrou plus vieux que stale_after secondes est considéré comme abandonné
+    (processus interrompu) et supprimé. Si le verrou n'est pas obtenu avant timeout
+    secondes, l'appelant continue sans verrou plutôt que de rester bloqué.
+    """
+
+    def __init__(self, path, timeout=120, stale_after=300, poll_interval=0.1):
+        self.path = path
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self.acquired = False
+        self.waited = False
+
+    def acquire(self):
+        """Prend le verrou; retourne True s'il a été obtenu. waited indique qu'il a fallu attendre."""
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                        logger.warning(f"Verrou abandonné supprimé: {self.path}")
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    # Le verrou vient d'être libéré
+                    continue
+                if time.time() >= deadline:
+                    logger.warning(f"Verrou {self.path} non obtenu après {self.timeout} s, poursuite sans verrou")
+                    return False
+                self.waited = True
+                time.sleep(self.poll_interval)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(f"{os.getpid()} {time.time()}")
+            self.acquired = True
+            return True
+
+    def release(self):
+        if self.acquired:
+            self.acquired = False
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class PageCache:
+    """
+    Cache de pages HTML adressé par contenu d'URL, avec index persistant.
+
+    Les fichiers sont écrits de façon atomique (fichier temporaire puis os.replace).
+    Les entrées modifiées sont ajoutées au journal sous un verrou fichier; l'index est
+    fusionné avec la version sur disque (index et journal) à chaque sauvegarde, pour que
+    plusieurs processus puissent partager le même répertoire.
+    """
+
+    INDEX_NAME = 'index.json'
+    JOURNAL_NAME = 'index.journal'
+    PAGES_NAME = 'pages'
+    LOCKS_NAME = 'locks'
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE, flush_interval=60):
+        """
+        Args:
+            cache_dir (str): Répertoire du cache
+            max_bytes (int): Taille totale maximale des pages, en octets
+            max_age (float): Âge maximal d'une page, en secondes
+            flush_interval (float): Délai maximal entre deux réécritures de l'index complet, en secondes
+        """
+        self.cache_dir = cache_dir
+        self.pages_dir = os.path.join(cache_dir, self.PAGES_NAME)
+        self.index_file = os.path.join(cache_dir, self.INDEX_NAME)
+        self.journal_file = os.path.join(cache_dir, self.JOURNAL_NAME)
+        self.locks_dir = os.path.join(cache_dir, self.LOCKS_NAME)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._deleted = set()
+        # Modifications (dates d'accès, entrées du journal) pas encore reportées dans l'index complet
+        self._dirty = False
+        self._last_save = time.monotonic()
+        os.makedirs(self.pages_dir, exist_ok=True)
+        os.makedirs(self.locks_dir, exist_ok=True)
+        self._index = self._read_index()
+
+    # --- Index -----------------------------------------------------------
+
+    def _read_index(self):
+        """
+        Charge l'index depuis le disque (index vide s'il est absent ou corrompu) et lui
+        applique les modifications du journal.
+        """
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if not isinstance(index, dict):
+                index = {}
+        except FileNotFoundError:
+            index = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Index du cache illisible, il sera reconstruit: {e}")
+            index = {}
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            lines = []
+        except OSError as e:
+            logger.warning(f"Journal du cache illisible: {e}")
+            lines = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+                key, entry = record['key'], record['entry']
+            except (ValueError, TypeError, KeyError):
+                # Ligne interrompue par l'arrêt d'un processus
+                continue
+            if entry is None:
+                index.pop(key, None)
+            else:
+                index[key] = self._merge_entry(index.get(key), entry)
+        return index
+
+    @staticmethod
+    def _merge_entry(current, entry):
+        """Réunit deux versions d'une entrée: la page la plus récente l'emporte."""
+        if current is None or current.get('fetched_at', 0) < entry.get('fetched_at', 0):
+            return entry
+        if current.get('fetched_at') == entry.get('fetched_at'):
+            # Même version de la page: réunit les extractions des deux versions
+            extractions = dict(current.get('extractions', {}), **entry.get('extractions', {}))
+            return dict(entry, extractions=extractions)
+        return dict(current, last_access=max(current.get('last_access', 0), entry.get('last_access', 0)))
+
+    def _journal_locked(self, key, entry):
+        """
+        Ajoute une entrée modifiée (ou supprimée, si entry est None) au journal, puis
+        réécrit l'index complet si la dernière sauvegarde date de plus de flush_interval.
+        """
+        self._dirty = True
+        if time.monotonic() - self._last_save >= self.flush_interval:
+            self._evict_locked()
+            self._save_index()
+            return
+        line = json.dumps({'key': key, 'entry': entry}) + '\n'
+        with FileLock(os.path.join(self.locks_dir, 'index.lock'), timeout=10, stale_after=30):
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def _write_atomic(self, path, data):
+        """Écrit des octets dans path sans jamais laisser de fichier partiellement écrit."""
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _merge_disk_index(self):
+        """Fusionne dans l'index en mémoire les entrées écrites sur disque par d'autres processus."""
+        merged = self._read_index()
+        for key in self._deleted:
+            merged.pop(key, None)
+        for key, entry in self._index.items():
+            # Conserve l'entrée la plus récente si un autre processus l'a mise à jour
+            merged[key] = self._merge_entry(merged.get(key), entry)
+        self._index = merged
+
+    def _save_index(self):
+        """Fusionne l'index en mémoire avec celui sur disque (journal compris), l'enregistre et vide le journal."""
+        with self._lock, FileLock(os.path.join(self.locks_dir, 'index.lock'), timeout=10, stale_after=30):
+            self._merge_disk_index()
+            self._deleted.clear()
+            self._dirty = False
+            self._last_save = time.monotonic()
+            self._write_atomic(self.index_file, json.dumps(self._index, indent=1).encode('utf-8'))
+            try:
+                os.remove(self.journal_file)
+            except FileNotFoundError:
+                pass
+
+    def refresh(self):
+        """Relit l'index sur disque pour voir les pages enregistrées entre-temps par d'autres processus."""
+        with self._lock:
+            self._merge_disk_index()
+
+    def _page_path(self, key):
+        return os.path.join(self.pages_dir, f"{key}.html")
+
+    # --- API publique ----------------------------------------------------
+
+    def fetch_lock(self, url, timeout=120):
+        """
+        Verrou inter-processus de récupération d'une page: un seul processus télécharge
+        une URL donnée à la fois, les autres attendent puis relisent le cache.
+        """
+        return FileLock(os.path.join(self.locks_dir, f"{cache_key(url)}.lock"), timeout=timeout)
+
+    def lookup(self, url):
+        """Retourne les métadonnées d'une entrée (même expirée) ou None, avec son âge en secondes."""
+        with self._lock:
+            entry = self._index.get(cache_key(url))
+            if entry is None:
+                return None
+            return dict(entry, age=time.time() - entry.get('fetched_at', 0))
+
+    def get(self, url, max_age=None):
+        """
+        Retourne le HTML en cache pour url, ou None si absent ou plus vieux que max_age secondes.
+        Un accès réussi met à jour la date de dernier accès utilisée par l'éviction LRU.
+        Une page partielle (lecture en flux interrompue) n'est jamais renvoyée: un autre
+        sélecteur ou une autre version du parser peut chercher au-delà de la coupure, et
+        seule l'extraction enregistrée avec la page (get_extraction) est réutilisable.
+        """
+        key = cache_key(url)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None or entry.get('partial'):
+                return None
+            age = time.time() - entry.get('fetched_at', 0)
+            if max_age is not None and age >= max_age:
+                return None
+        try:
+            with open(self._page_path(key), 'rb') as f:
+                content = f.read()
+        except OSError:
+            # Le fichier a disparu: l'entrée d'index est orpheline
+            with self._lock:
+                self._index.pop(key, None)
+                self._deleted.add(key)
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index[key]['last_access'] = time.time()
+                self._dirty = True
+        return content.decode('utf-8', errors='replace')
+
+    def put(self, url, content, headers=None, partial=False):
+        """
+        Enregistre une page dans le cache avec ses validateurs HTTP (ETag, Last-Modified).
+
+        Args:
+            url (str): URL de la page
+            content (str|bytes): Contenu HTML
+            headers (Mapping): En-têtes de la réponse HTTP, optionnels
+            partial (bool): Vrai si seul le début de la page a été téléchargé (lecture en flux)
+
+        Returns:
+            dict: L'entrée d'index créée
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        headers = headers or {}
+        key = cache_key(url)
+        now = time.time()
+        self._write_atomic(self._page_path(key), content)
+        entry = {
+            'url': canonical_url(url),
+            'fetched_at': now,
+            'last_access': now,
+            'size': len(content),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'partial': partial,
+        }
+        with self._lock:
+            self._index[key] = entry
+            self._deleted.discard(key)
+            self._journal_locked(key, entry)
+        return entry
+
+    def conditional_headers(self, url):
+        """
+        Construit les en-têtes de requête conditionnelle (If-None-Match, If-Modified-Since)
+        à partir des validateurs enregistrés pour cette page.
+        """
+        with self._lock:
+            entry = self._index.get(cache_key(url))
+            if entry is None:
+                return {}
+            headers = {}
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            return headers
+
+    def revalidate(self, url, headers=None):
+        """
+        Marque une entrée comme fraîche après une réponse 304 Not Modified.
+        Le HTML et les extractions sont conservés; les validateurs renvoyés par le serveur
+        remplacent les anciens.
+
+        Returns:
+            bool: True si l'entrée existait
+        """
+        headers = headers or {}
+        key = cache_key(url)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return False
+            now = time.time()
+            entry['fetched_at'] = now
+            entry['last_access'] = now
+            if headers.get('ETag'):
+                entry['etag'] = headers['ETag']
+            if headers.get('Last-Modified'):
+                entry['last_modified'] = headers['Last-Modified']
+            self._journal_locked(key, entry)
+            return True
+
+    @staticmethod
+    def _extraction_key(css_selector, parser_version):
+        return f"{parser_version}|{css_selector or ''}"
+
+    def get_extraction(self, url, css_selector, parser_version, max_age=None):
+        """
+        Retourne le résultat d'extraction mis en cache pour cette page, ce sélecteur et
+        cette version du parser, sans relire ni ré-analyser le HTML.
+
+        Args:
+            url (str): URL de la page
+            css_selector (str): Sélecteur de prix utilisé lors de l'extraction
+            parser_version (str): Version des résultats (voir EcommerceParser.extraction_version)
+            max_age (float): Âge maximum de la page en secondes, ou None pour ignorer l'âge
+
+        Returns:
+            dict: Champs extraits (price_text, numeric_price, currency, title...), ou None
+        """
+        key = cache_key(url)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            if max_age is not None and time.time() - entry.get('fetched_at', 0) >= max_age:
+                return None
+            result = entry.get('extractions', {}).get(self._extraction_key(css_selector, parser_version))
+            if result is None:
+                return None
+            entry['last_access'] = time.time()
+            self._dirty = True
+            return dict(result)
+
+    def put_extraction(self, url, css_selector, parser_version, result):
+        """
+        Associe un résultat d'extraction à la page en cache (limité à EXTRACTION_FIELDS).
+        Les résultats produits par d'autres versions du parser sont supprimés.
+        """
+        key = cache_key(url)
+        prefix = f"{parser_version}|"
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return
+            extractions = {
+                name: value for name, value in entry.get('extractions', {}).items()
+                if name.startswith(prefix)
+            }
+            extractions[self._extraction_key(css_selector, parser_version)] = {
+                field: result.get(field) for field in EXTRACTION_FIELDS
+            }
+            entry['extractions'] = extractions
+            self._journal_locked(key, entry)
+
+    def delete(self, url):
+        """Supprime une entrée du cache."""
+        key = cache_key(url)
+        with self._lock:
+            self._index.pop(key, None)
+            self._deleted.add(key)
+            self._remove_file(key)
+            self._journal_locked(key, None)
+
+    def _remove_file(self, key):
+        try:
+            os.remove(self._page_path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Impossible de supprimer l'entrée de cache {key}: {e}")
+
+    def _evict_locked(self):
+        """Applique le TTL puis la limite de taille (LRU). Retourne le nombre d'entrées supprimées."""
+        now = time.time()
+        removed = 0
+        for key, entry in list(self._index.items()):
+            if now - entry.get('fetched_at', 0) >= self.max_age:
+                self._index.pop(key)
+                self._deleted.add(key)
+                self._remove_file(key)
+                removed += 1
+
+        total = sum(entry.get('size', 0) for entry in self._index.values())
+        if total > self.max_bytes:
+            for key, entry in sorted(self._index.items(), key=lambda item: item[1].get('last_access', 0)):
+                if total <= self.max_bytes:
+                    break
+                self._index.pop(key)
+                self._deleted.add(key)
+                self._remove_file(key)
+                total -= entry.get('size', 0)
+                removed += 1
+        return removed
+
+    def evict(self):
+        """
+        Supprime les entrées expirées, réduit le cache sous max_bytes et efface
+        les fichiers de pages qui ne sont plus référencés par l'index.
+
+        Returns:
+            int: Nombre de fichiers supprimés
+        """
+        with self._lock:
+            # Récupère d'abord les entrées ajoutées par d'autres processus
+            self._save_index()
+            removed = self._evict_locked()
+            known = set(self._index)
+            for name in os.listdir(self.pages_dir):
+                key, ext = os.path.splitext(name)
+                path = os.path.join(self.pages_dir, name)
+                if ext == '.html' and key in known:
+                    continue
+                # Ne touche pas aux écritures en cours d'un autre processus
+                if ext == '.tmp' and time.time() - os.path.getmtime(path) < 3600:
+                    continue
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError as e:
+                    logger.warning(f"Impossible de supprimer le fichier orphelin {name}: {e}")
+            self._save_index()
+        return removed
+
+    def flush(self):
+        """Applique l'éviction et enregistre dans l'index les modifications et dates d'accès en attente."""
+        with self._lock:
+            if self._dirty or self._deleted:
+                self._evict_locked()
+                self._save_index()
+
+    def stats(self):
+        """Retourne le nombre d'entrées et la taille totale du cache."""
+        with self._lock:
+            return {
+                'entries': len(self._index),
+                'total_bytes': sum(entry.get('size', 0) for entry in self._index.values()),
+                'max_bytes': self.max_bytes,
+                'max_age': self.max_age,
+            }
+
+
+class NegativeCache:
+    """
+    Cache des échecs durables par URL canonique: pages disparues (404/410) ou pages
+    dont aucun prix ne peut être extrait. Chaque échec consécutif double l'intervalle
+    avant la prochaine vérification (jusqu'à max_interval); un succès efface l'entrée.
+    Le fichier est relu et réécrit sous verrou à chaque modification, pour être partagé
+    entre processus.
+    """
+
+    FILE_NAME = 'negative.json'
+
+    def __init__(self, cache_dir=CACHE_DIR, base_interval=6 * 3600, max_interval=7 * 24 * 3600):
+        """
+        Args:
+            cache_dir (str): Répertoire du cache
+            base_interval (float): Délai avant nouvelle vérification après le premier échec, en secondes
+            max_interval (float): Délai maximal entre deux vérifications, en secondes
+        """
+        self.path = os.path.join(cache_dir, self.FILE_NAME)
+        self.lock_path = os.path.join(cache_dir, PageCache.LOCKS_NAME, 'negative.lock')
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        self._entries = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            return entries if isinstance(entries, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cache négatif illisible, il sera reconstruit: {e}")
+            return {}
+
+    def _update(self, key, update):
+        """Applique update(entrées) à la version sur disque, sous verrou, puis l'enregistre."""
+        with self._lock, FileLock(self.lock_path, timeout=10, stale_after=30):
+            entries = self._read()
+            update(entries)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, indent=1)
+            os.replace(tmp_path, self.path)
+            self._entries = entries
+
+    def record(self, url, failure):
+        """
+        Enregistre un échec durable et retourne l'entrée mise à jour.
+
+        Args:
+            url (str): URL du produit
+            failure (str): Classe d'échec ('not_found', 'no_price')
+        """
+        key = cache_key(url)
+        now = time.time()
+        result = {}
+
+        def update(entries):
+            entry = entries.get(key, {'url': canonical_url(url), 'first_seen': now, 'failures': 0})
+            entry['failures'] = entry['failures'] + 1 if entry.get('failure') == failure else 1
+            entry['failure'] = failure
+            entry['last_checked'] = now
+            entry['next_check'] = now + min(self.base_interval * 2 ** (entry['failures'] - 1), self.max_interval)
+            entries[key] = entry
+            result.update(entry)
+
+        self._update(key, update)
+        logger.info(f"Échec durable ({failure}) enregistré pour {url}, "
+                    f"prochaine vérification dans {(result['next_check'] - now) / 3600:.0f} h")
+        return result
+
+    def clear(self, url):
+        """Efface l'entrée d'une URL qui répond à nouveau normalement."""
+        key = cache_key(url)
+        with self._lock:
+            if key not in self._entries:
+                return
+        self._update(key, lambda entries: entries.pop(key, None))
+
+    def should_skip(self, url):
+        """Retourne l'entrée si l'URL ne doit pas encore être revérifiée, sinon None."""
+        with self._lock:
+            entry = self._entries.get(cache_key(url))
+        if entry is None or time.time() >= entry.get('next_check', 0):
+            return None
+        return dict(entry)
+
+    def report(self):
+        """Liste des URL en échec durable, triées par date de prochaine vérification."""
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+        return sorted(entries, key=lambda entry: entry.get('next_check', 0))
+
+
+def _git_tracked_names(directory):
+    """Noms des fichiers de directory suivis par git (ensemble vide hors d'un dépôt git)."""
+    try:
+        completed = subprocess.run(
+            ['git', 'ls-files', '-z', '--', '.'],
+            cwd=directory, capture_output=True, timeout=30, check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return set()
+    return {
+        os.path.basename(path)
+        for path in completed.stdout.decode('utf-8', errors='replace').split('\0')
+        if path and os.sep not in path and '/' not in path
+    }
+
+
+def purge_legacy_files(cache_dir=CACHE_DIR):
+    """
+    Supprime les anciens fichiers de cache nommés avec hash() (domaine_hash.html),
+    que le cache indexé n'utilise plus. Les pages suivies par git sont conservées:
+    ce sont les pages de référence des benchmarks (benchmark.py, replay.py seed).
+
+    Returns:
+        int: Nombre de fichiers supprimés
+    """
+    removed = 0
+    if not os.path.isdir(cache_dir):
+        return removed
+    tracked = _git_tracked_names(cache_dir)
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith('.html') and name not in tracked and os.path.isfile(path):
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Impossible de supprimer l'ancien fichier de cache {name}: {e}")
+    return removed
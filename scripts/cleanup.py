@@ -6,6 +6,11 @@ import shutil
 import sys
 from datetime import datetime
 
+# Ajoute le répertoire parent au sys.path pour importer le module de cache
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.cache import PageCache, purge_legacy_files
+
 def clean_files():
     """Nettoie les fichiers temporaires et les caches"""
     print("Nettoyage des fichiers temporaires...")
@@ -40,14 +45,11 @@ def clean_files():
                 except Exception as e:
                     print(f"Erreur lors de la suppression de {pyc_file}: {e}")
     
-    # Supprimer le dossier cache s'il existe
-    cache_dir = os.path.join(base_dir, 'cache')
-    if os.path.exists(cache_dir):
-        print(f"Suppression du dossier cache: {cache_dir}")
-        try:
-            shutil.rmtree(cache_dir)
-        except Exception as e:
-            print(f"Erreur lors de la suppression du dossier cache: {e}")
+    # Purger le cache des pages: entrées expirées, dépassement de taille et fichiers orphelins
+    page_cache = PageCache()
+    cache_files_removed = page_cache.evict()
+    cache_files_removed += purge_legacy_files(page_cache.cache_dir)
+    cache_stats = page_cache.stats()
     
     # Nettoyer les logs anciens
     logs_dir = os.path.join(base_dir, 'logs')
@@ -72,10 +74,8 @@ def clean_files():
     print(f"- {pyc_count} fichiers .pyc supprimés")
     print(f"- {log_files_cleaned} fichiers de log nettoyés")
     
-    if os.path.exists(cache_dir):
-        print("⚠️ Attention: Le dossier cache n'a pas pu être supprimé entièrement")
-    else:
-        print("- Dossier cache supprimé avec succès")
+    print(f"- {cache_files_removed} fichiers de cache supprimés")
+    print(f"- Cache conservé: {cache_stats['entries']} pages, {cache_stats['total_bytes'] / (1024 * 1024):.1f} Mo")
 
 if __name__ == "__main__":
     clean_files()
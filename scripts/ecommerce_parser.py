@@ -2,86 +2,91 @@
 Sélecteurs spécifiques aux sites e-commerce et logique d'analyse.
 Ce module fournit une gestion spécialisée pour différentes plateformes e-commerce.
 """
+import html
 import logging
+import random
 import re
-from bs4 import BeautifulSoup
+import time
+from urllib.parse import urlparse
+from scripts.html_backends import DEFAULT_BACKEND, make_document, precompile_selectors
+from scripts.selector_engine import FieldExtractor
+from scripts.selector_stats import selector_stats
+from scripts.sites import DEFAULT_CURRENCY_SYMBOLS, FIELDS, site_registry
+from scripts.structured_data import extract_structured_data
+from scripts.templates import template_cache, template_fingerprint
 
 logger = logging.getLogger('ecommerce_parser')
 
 class EcommerceParser:
     """Classe d'analyse pour les sites web e-commerce avec une logique spécifique au site."""
     
+    # À incrémenter à chaque changement de logique d'extraction: les résultats d'extraction
+    # mis en cache par une autre version sont ignorés. Les changements de data/sites.json
+    # sont pris en compte par l'empreinte du profil (voir extraction_version).
+    PARSER_VERSION = 4
+    
+    @staticmethod
+    def extraction_version(url):
+        """
+        Version des résultats d'extraction d'une page, pour le cache: version du parser et
+        empreinte du profil de son site, pour qu'une modification des sélecteurs ou des motifs
+        du site dans data/sites.json invalide les extractions déjà en cache.
+        """
+        return f"{EcommerceParser.PARSER_VERSION}-{site_registry.for_url(url).digest}"
+    
     @staticmethod
     def detect_site(url):
-        """Détecter à quel site e-commerce appartient l'URL."""
-        if "amazon" in url:
-            return "amazon"
-        elif "cdiscount" in url:
-            return "cdiscount"
-        elif "fnac" in url:
-            return "fnac"
-        elif "darty" in url:
-            return "darty"
-        elif "boulanger" in url:
-            return "boulanger"
-        elif "leclerc" in url:
-            return "leclerc"
-        else:
-            return "generic"
+        """Détecter à quel site e-commerce appartient l'URL (d'après son hôte, voir scripts.sites)."""
+        return site_registry.for_url(url).name
     
     @staticmethod
     def get_selectors(site):
-        """Obtenir les sélecteurs CSS appropriés pour un site donné."""
-        selectors = {
-            "amazon": {
-                "price": [".a-price .a-offscreen", ".a-price-whole", "#priceblock_ourprice", "#priceblock_dealprice", ".a-section .a-color-price"],
-                "title": ["#productTitle", "#title", ".product-title-word-break"],
-                "availability": ["#availability", "#deliveryMessageMirId", ".a-section.a-spacing-base"],
-                "image": ["#landingImage", "#imgBlkFront", "#main-image"]
-            },
-            "cdiscount": {
-                "price": [".fpPrice", ".price", ".jsMainPrice"],
-                "title": ["h1", ".fpDesColumn h1", ".prdtBILTit"],
-                "availability": [".fpStockLevel", ".stockLevel", ".fpStockLevelBar"],
-                "image": [".prdtVisual img", ".jsPrdtBlocImg img"]
-            },
-            "fnac": {
-                "price": [".userPrice", ".f-priceBox__price", ".Article-price"],
-                "title": [".f-productHeader-Title", ".Article-infoContent h1"],
-                "availability": [".f-buyBox-availabilityStatus", ".Article-availability"],
-                "image": [".f-productVisuals-mainVisual img", ".Article-imageContainer img"]
-            },
-            "darty": {
-                "price": [".product_price", ".price", ".darty_prix_produit"],
-                "title": [".product_name", "h1.product_title"],
-                "availability": [".availability-msg", ".product_stock"],
-                "image": [".product_image img", ".product_img img"]
-            },
-            "boulanger": {
-                "price": [".price__amount", ".main-price", ".price"],
-                "title": [".product-title", "h1.title"],
-                "availability": [".product-availability", ".stock-notification"],
-                "image": [".product-gallery img", ".carousel-item img"]
-            },
-            "leclerc": {
-                "price": [".product-price", ".price", ".current-price"],
-                "title": [".product-title", ".product-name", "h1"],
-                "availability": [".availability", ".stock-status"],
-                "image": [".product-image img", ".main-image img"]
-            },
-            "generic": {
-                "price": [".price", ".product-price", "[itemprop='price']", ".current-price", ".sales-price"],
-                "title": ["h1", ".product-title", "[itemprop='name']", ".product-name"],
-                "availability": [".availability", ".stock-status", "[itemprop='availability']"],
-                "image": [".product-image img", "[itemprop='image']", ".main-image img"]
-            }
-        }
-        return selectors.get(site, selectors["generic"])
+        """Obtenir les sélecteurs CSS d'un site donné, tels que chargés dans le registre des sites."""
+        return site_registry.get(site).selectors
+    
+    # Marqueurs de lecture en flux calculés par site
+    _stream_markers = {}
+    
+    # Extracteurs en un seul parcours, par site et sélecteur de prix personnalisé
+    _extractors = {}
     
     @staticmethod
-    def clean_price(price_text, currency_symbols=('€', '$', '£', '¥')):
+    def get_stream_markers(site, css_selector=None):
+        """
+        Obtenir, pour chaque champ, un marqueur d'octets signalant sa présence dans le document.
+        Le marqueur est dérivé du sélecteur prioritaire du champ (id, classe ou balise de son
+        dernier élément) et permet d'arrêter un téléchargement en flux dès que tous les champs
+        ont été vus. Le prix d'un produit qui a son propre sélecteur est marqué par ce sélecteur.
+        """
+        key = (site, css_selector)
+        markers = EcommerceParser._stream_markers.get(key)
+        if markers is None:
+            markers = {}
+            for element_type, selector_list in EcommerceParser.get_selectors(site).items():
+                if selector_list:
+                    markers[element_type] = EcommerceParser._stream_marker(selector_list[0])
+            if css_selector not in (None, "", "auto"):
+                markers["price"] = EcommerceParser._stream_marker(css_selector)
+            EcommerceParser._stream_markers[key] = markers
+        return markers
+    
+    @staticmethod
+    def _stream_marker(selector):
+        last_part = selector.split()[-1]
+        element_id = re.search(r"#([\w-]+)", last_part)
+        token = re.search(r"\.([\w-]+)|\[[\w-]+=['\"]?([\w-]+)", last_part)
+        if element_id:
+            # Ancré sur l'attribut pour ne pas s'arrêter sur une mention dans un script ou du CSS
+            return f'id="{element_id.group(1)}"'.encode('utf-8')
+        if token:
+            return (token.group(1) or token.group(2)).encode('utf-8')
+        return f"<{last_part}".encode('utf-8')
+    
+    @staticmethod
+    def clean_price(price_text, currency_symbols=DEFAULT_CURRENCY_SYMBOLS, thousands_separators=()):
         """
         Extract numeric price from text, handling various formats and currencies.
+        Thousands separators (e.g. the narrow no-break space in "1 299,99 €") are removed first.
         """
         if not price_text or price_text.lower() == 'none':
             return None
@@ -89,6 +94,8 @@ class EcommerceParser:
         # Remove currency symbols and spaces
         for symbol in currency_symbols:
             price_text = price_text.replace(symbol, '')
+        for separator in thousands_separators:
+            price_text = price_text.replace(separator, '')
         
         # Remove non-breaking spaces and other whitespace
         price_text = price_text.replace('\xa0', ' ').strip()
@@ -109,9 +116,9 @@ class EcommerceParser:
             return None
     
     @staticmethod
-    def extract_currency(price_text):
+    def extract_currency(price_text, currency_symbols=DEFAULT_CURRENCY_SYMBOLS):
         """Extract currency symbol from price text."""
-        for symbol in ('€', '$', '£', '¥'):
+        for symbol in currency_symbols:
             if symbol in price_text:
                 return symbol
         return "Unknown"
@@ -126,48 +133,226 @@ class EcommerceParser:
         return None
     
     @staticmethod
-    def parse_page(html_content, url, css_selector=None):
+    def absolute_url(link, page_url):
+        """Handle relative URLs (starting with '/') by prefixing the page's scheme and host."""
+        if link and link.startswith('/'):
+            parsed_url = urlparse(page_url)
+            return f"{parsed_url.scheme}://{parsed_url.netloc}{link}"
+        return link
+    
+    @staticmethod
+    def get_extractor(site, css_selector=None):
+        """
+        Obtenir l'extracteur qui résout tous les champs d'un site en un seul parcours du document.
+        Le sélecteur personnalisé, s'il est fourni, est un champ à part prioritaire sur les
+        sélecteurs de prix du site. Les sélecteurs de chaque champ gardent l'ordre de priorité
+        de data/sites.json: le premier qui correspond fournit la valeur (extract_fields n'essaie
+        en premier le sélecteur gagnant récemment que lorsque ce résultat n'en dépend pas).
+        """
+        key = (site, css_selector)
+        extractor = EcommerceParser._extractors.get(key)
+        if extractor is None:
+            selectors = EcommerceParser.get_selectors(site)
+            fields = []
+            if css_selector:
+                fields.append(("custom_price", [css_selector], None))
+            fields.extend([
+                ("price", selectors.get("price", []), None),
+                ("title", selectors.get("title", []), None),
+                ("availability", selectors.get("availability", []), None),
+                ("image", selectors.get("image", []), "src"),
+            ])
+            extractor = FieldExtractor(fields)
+            EcommerceParser._extractors[key] = extractor
+        return extractor
+    
+    @staticmethod
+    def extract_fields(document, html_content, site, css_selector=None, scoped=False):
+        """
+        Localiser les champs d'une page analysée. Si le gabarit de la page (template_fingerprint)
+        est connu, les champs dont le nœud est sûrement celui d'un parcours complet sont pris
+        directement à leurs chemins (FieldExtractor.locate) et les autres sont cherchés; sinon
+        le document est parcouru par l'extracteur, en commençant par les sélecteurs gagnants
+        récemment (selector_stats) quand le HTML brut exclut les sélecteurs plus prioritaires
+        (FieldExtractor.leading). Le gabarit est (ré)appris quand ses chemins changent, à
+        condition qu'un prix ait été trouvé.
+        
+        Returns:
+            tuple: (correspondances par champ, infos de gabarit: key, state ('known' si tous les
+                   champs viennent du gabarit, 'mismatch' si certains ont été cherchés, 'unknown'),
+                   extract_ms et fields (chemins appris, ou None))
+        """
+        extractor = EcommerceParser.get_extractor(site, css_selector)
+        # Le calcul de l'empreinte fait partie du coût d'extraction mesuré
+        start = time.perf_counter()
+        key = template_fingerprint(html_content, css_selector, scoped)
+        known = template_cache.get(site, key)
+        located = extractor.locate(document, known, html_content) if known else None
+        fields = None
+        if located is not None:
+            matches, searched = located
+            state = 'mismatch' if searched else 'known'
+        else:
+            state = 'mismatch' if known else 'unknown'
+            matches = extractor.leading(selector_stats.leaders(site), html_content).extract(document)
+        extract_ms = (time.perf_counter() - start) * 1000
+        if state != 'known' and (matches.get("custom_price") or matches.get("price")):
+            fields = extractor.node_paths(document, matches)
+            if fields != known:
+                template_cache.learn(site, key, fields)
+            else:
+                fields = None
+        return matches, {"key": key, "state": state, "extract_ms": extract_ms, "fields": fields}
+    
+    # Sites dont la lecture directe a divergé du DOM dans ce processus: le DOM est alors toujours utilisé
+    _scan_disabled = set()
+    
+    @staticmethod
+    def scan_page(content, url, profile=None):
+        """
+        Lire les champs directement dans le HTML brut (texte ou octets) avec les motifs
+        compilés du site (profil 'scan' de data/sites.json), sans construire de DOM.
+        
+        Returns:
+            dict: Résultat au format de parse_page, ou None si le site n'a pas de motifs
+                  ou si un champ décrit par un motif (ou le prix, ou le titre) est introuvable
+        """
+        profile = profile or site_registry.for_url(url)
+        if not profile.scan or profile.name in EcommerceParser._scan_disabled:
+            return None
+        binary = isinstance(content, (bytes, bytearray))
+        values = {}
+        for field in FIELDS:
+            patterns = profile.scan_patterns(field, binary)
+            if not patterns:
+                values[field] = None
+                continue
+            match = next((m for m in (pattern.search(content) for pattern in patterns) if m), None)
+            if match is None:
+                return None
+            value = match.group(1)
+            if binary:
+                value = value.decode('utf-8', errors='replace')
+            values[field] = html.unescape(value).strip() or None
+        price_text = values["price"]
+        if not price_text or not values["title"]:
+            return None
+        return {
+            "price_text": price_text,
+            "numeric_price": EcommerceParser.clean_price(
+                price_text, profile.currency_symbols, profile.thousands_separators),
+            "currency": EcommerceParser.extract_currency(price_text, profile.currency_symbols),
+            "title": values["title"],
+            "availability": values["availability"],
+            "image_url": EcommerceParser.absolute_url(values["image"], url),
+            "site": profile.name
+        }
+    
+    @staticmethod
+    def parse_page(html_content, url, css_selector=None, backend=DEFAULT_BACKEND):
         """
         Parse e-commerce page and extract product data.
         If a specific CSS selector is provided, it will be used for the price.
         Otherwise, site-specific selectors will be tried.
+        The backend is either 'html.parser' (BeautifulSoup) or 'lxml' (precompiled XPath selectors);
+        both return the same results. All fields are resolved in a single pass over the document.
+        On sites whose profile enables structured_data, JSON-LD/microdata/OpenGraph price data is
+        read first without building the DOM; the CSS selectors are only used when it yields no price.
+        On sites with scan patterns, the fields are read from the raw HTML (scan_page), unless the
+        product has its own price selector other than the one the price pattern reproduces
+        (the profile's scan.price_selector); a sample
+        of those pages (the profile's validation_rate) is also parsed to check the scan against
+        the DOM, and the DOM result is used whenever the scan misses or disagrees. The "scan" key
+        of the result tells which happened ('hit', 'validated', 'mismatch' or 'miss').
         """
-        soup = BeautifulSoup(html_content, 'html.parser')
-        site = EcommerceParser.detect_site(url)
-        selectors = EcommerceParser.get_selectors(site)
+        profile = site_registry.for_url(url)
+        site = profile.name
+        default_selector = css_selector in (None, "", "auto")
         
-        # Extract price
-        price_text = None
-        if css_selector:
-            # Use provided selector if available
-            element = soup.select_one(css_selector)
-            if element:
-                price_text = element.get_text(strip=True)
+        # Fast path: structured data, unless the product has its own price selector
+        if profile.structured_data and default_selector:
+            structured = extract_structured_data(html_content)
+            if structured:
+                return {
+                    "price_text": structured["price_text"],
+                    "numeric_price": structured["numeric_price"],
+                    "currency": structured["currency"],
+                    "title": structured["title"] or "Unknown Product",
+                    "availability": structured["availability"],
+                    "image_url": EcommerceParser.absolute_url(structured["image_url"], url),
+                    "site": site
+                }
+        
+        # Fast path: scan patterns, unless the product's price selector is not the one they reproduce
+        if not profile.scan or not (default_selector or css_selector == profile.scan_price_selector):
+            return EcommerceParser.parse_dom(html_content, url, css_selector, backend, profile)
+        scanned = EcommerceParser.scan_page(html_content, url, profile)
+        if scanned is None:
+            result = EcommerceParser.parse_dom(html_content, url, css_selector, backend, profile)
+            result["scan"] = "miss"
+            return result
+        if random.random() >= profile.scan_validation_rate:
+            scanned["scan"] = "hit"
+            return scanned
+        
+        result = EcommerceParser.parse_dom(html_content, url, css_selector, backend, profile)
+        differences = [key for key in scanned if scanned[key] != result[key]]
+        if differences:
+            logger.warning(f"Lecture directe différente du DOM pour {url} ({', '.join(differences)}): "
+                           f"lecture directe désactivée pour {site} dans ce processus")
+            EcommerceParser._scan_disabled.add(site)
+            result["scan"] = "mismatch"
+        else:
+            result["scan"] = "validated"
+        return result
+    
+    @staticmethod
+    def parse_dom(html_content, url, css_selector=None, backend=DEFAULT_BACKEND, profile=None, scoped=True):
+        """
+        Extraction par le DOM seul (sans données structurées ni lecture directe, voir parse_page).
+        Avec le backend html.parser, seuls les conteneurs du parse_scope du site sont construits
+        (SoupStrainer); si le prix (celui du sélecteur personnalisé, s'il est donné) ou le titre
+        n'y est pas, la page entière est analysée.
+        scoped=False construit toujours l'arbre complet.
+        """
+        profile = profile or site_registry.for_url(url)
+        site = profile.name
+        
+        matches = None
+        if scoped and profile.parse_scope and backend == 'html.parser':
+            soup = make_document(html_content, backend, profile.parse_scope)
+            matches, template = EcommerceParser.extract_fields(soup, html_content, site, css_selector, scoped=True)
+            # Le sélecteur personnalisé du produit peut viser un élément hors des conteneurs du site
+            price_field = "custom_price" if css_selector else "price"
+            if not matches.get(price_field) or not matches.get("title"):
+                logger.debug(f"Champs hors des conteneurs de {site} pour {url}, analyse de la page entière")
+                matches = None
+        if matches is None:
+            soup = make_document(html_content, backend)
+            matches, template = EcommerceParser.extract_fields(soup, html_content, site, css_selector)
         
-        # If no price found with provided selector, try site-specific selectors
+        def text_of(field):
+            match = matches.get(field)
+            return match[1].get_text(strip=True) if match else None
+        
+        # Use provided selector if available, then fall back to site-specific selectors
+        price_text = text_of("custom_price")
         if not price_text:
-            price_text = EcommerceParser.extract_data(soup, selectors, "price")
+            price_text = text_of("price")
         
         # Extract other product data
-        title = EcommerceParser.extract_data(soup, selectors, "title")
-        availability = EcommerceParser.extract_data(soup, selectors, "availability")
+        title = text_of("title")
+        availability = text_of("availability")
         
         # Get image URL
         image_url = None
-        for selector in selectors.get("image", []):
-            img_element = soup.select_one(selector)
-            if img_element and img_element.has_attr('src'):
-                image_url = img_element['src']
-                # Handle relative URLs
-                if image_url and image_url.startswith('/'):
-                    from urllib.parse import urlparse
-                    parsed_url = urlparse(url)
-                    image_url = f"{parsed_url.scheme}://{parsed_url.netloc}{image_url}"
-                break
+        if matches.get("image"):
+            image_url = EcommerceParser.absolute_url(matches["image"][1]['src'], url)
         
         # Clean and extract numeric price
-        numeric_price = EcommerceParser.clean_price(price_text) if price_text else None
-        currency = EcommerceParser.extract_currency(price_text) if price_text else "Unknown"
+        numeric_price = EcommerceParser.clean_price(
+            price_text, profile.currency_symbols, profile.thousands_separators) if price_text else None
+        currency = EcommerceParser.extract_currency(price_text, profile.currency_symbols) if price_text else "Unknown"
         
         return {
             "price_text": price_text,
@@ -176,5 +361,20 @@ class EcommerceParser:
             "title": title or "Unknown Product",
             "availability": availability,
             "image_url": image_url,
-            "site": site
+            "site": site,
+            # Sélecteur retenu par champ, pour selector_stats (et le sélecteur personnalisé, s'il est donné)
+            "selectors": {
+                field: matches[field][0] if matches.get(field) else None
+                for field in (("custom_price",) + FIELDS if css_selector else FIELDS)
+            },
+            # Usage du cache des gabarits, pour template_cache.record
+            "template": template
         }
+
+# Compile une seule fois les sélecteurs de tous les sites du registre pour le backend lxml
+precompile_selectors(
+    selector
+    for profile in site_registry.profiles()
+    for selector_list in profile.selectors.values()
+    for selector in selector_list
+)
@@ -0,0 +1,144 @@
+"""
+Backends d'analyse HTML utilisés par EcommerceParser.
+Le backend par défaut ('html.parser') utilise BeautifulSoup et soupsieve. Le backend 'lxml'
+analyse la page avec lxml et évalue des sélecteurs CSS compilés une seule fois en XPath;
+il expose la même petite API que BeautifulSoup (select_one, get_text, has_attr) pour que
+la logique d'extraction reste identique quel que soit le backend.
+"""
+import logging
+import re
+import threading
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+    from cssselect import HTMLTranslator
+except ImportError:  # lxml/cssselect absents: seul le backend html.parser est disponible
+    etree = None
+    lxml_html = None
+    HTMLTranslator = None
+
+logger = logging.getLogger('html_backends')
+
+DEFAULT_BACKEND = 'html.parser'
+
+# Balises dont le contenu n'est pas du texte visible (exclues par BeautifulSoup.get_text)
+_NON_TEXT_TAGS = frozenset(('script', 'style', 'template'))
+
+# Déclaration XML en tête des pages XHTML: lxml refuse une chaîne qui en porte une, alors
+# que le texte est déjà décodé (son encodage ne s'applique plus)
+_XML_DECLARATION_RE = re.compile(r'\A\ufeff?\s*<\?xml[^>]*>')
+
+# Sélecteurs CSS déjà compilés en XPath
+_compiled_selectors = {}
+_compile_lock = threading.Lock()
+
+
+def compile_selector(selector):
+    """Compile un sélecteur CSS en expression XPath lxml (mise en cache)."""
+    compiled = _compiled_selectors.get(selector)
+    if compiled is None:
+        if HTMLTranslator is None:
+            raise ImportError("Le backend lxml nécessite les paquets lxml et cssselect")
+        compiled = etree.XPath(HTMLTranslator().css_to_xpath(selector))
+        with _compile_lock:
+            _compiled_selectors[selector] = compiled
+    return compiled
+
+
+def precompile_selectors(selectors):
+    """Compile à l'avance une liste de sélecteurs CSS, si lxml est disponible."""
+    if HTMLTranslator is None:
+        return
+    for selector in selectors:
+        try:
+            compile_selector(selector)
+        except Exception as e:
+            logger.warning(f"Sélecteur non compilable en XPath: {selector} ({e})")
+
+
+class LxmlElement:
+    """Élément lxml exposant l'API de bs4.Tag utilisée par EcommerceParser."""
+
+    __slots__ = ('element',)
+
+    def __init__(self, element):
+        self.element = element
+
+    def get_text(self, strip=False):
+        """Équivalent de Tag.get_text: ignore commentaires, scripts, styles et templates."""
+        parts = []
+        _collect_text(self.element, parts)
+        if strip:
+            return ''.join(part.strip() for part in parts)
+        return ''.join(parts)
+
+    def has_attr(self, name):
+        return self.element.get(name) is not None
+
+    def get(self, name, default=None):
+        return self.element.get(name, default)
+
+    def __getitem__(self, name):
+        value = self.element.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+
+def _collect_text(element, parts):
+    if not isinstance(element.tag, str) or element.tag in _NON_TEXT_TAGS:
+        return
+    if element.text:
+        parts.append(element.text)
+    for child in element:
+        _collect_text(child, parts)
+        if child.tail:
+            parts.append(child.tail)
+
+
+class LxmlDocument:
+    """Document lxml exposant select_one comme BeautifulSoup."""
+
+    def __init__(self, html_content):
+        if lxml_html is None:
+            raise ImportError("Le backend lxml nécessite les paquets lxml et cssselect")
+        self.root = None
+        if html_content and html_content.strip():
+            if isinstance(html_content, str):
+                html_content = _XML_DECLARATION_RE.sub('', html_content, count=1)
+            try:
+                self.root = lxml_html.document_fromstring(html_content)
+            except (etree.ParserError, ValueError) as e:
+                logger.warning(f"Document HTML illisible par lxml: {e}")
+
+    def select_one(self, selector):
+        if self.root is None:
+            return None
+        matches = compile_selector(selector)(self.root)
+        return LxmlElement(matches[0]) if matches else None
+
+
+def make_document(html_content, backend=DEFAULT_BACKEND, scope_ids=None):
+    """
+    Analyse le HTML avec le backend demandé.
+
+    Args:
+        html_content (str): Contenu HTML
+        backend (str): 'html.parser' (BeautifulSoup) ou 'lxml'
+        scope_ids (frozenset): Identifiants des conteneurs à garder (html.parser uniquement):
+            seuls ces éléments et leurs descendants sont construits (SoupStrainer).
+            lxml construit l'arbre complet en C, plus vite qu'un filtrage en Python.
+
+    Returns:
+        Objet exposant select_one(selector)
+    """
+    if backend == 'lxml':
+        return LxmlDocument(html_content)
+    if backend == 'html.parser':
+        if scope_ids:
+            return BeautifulSoup(html_content, 'html.parser', parse_only=SoupStrainer(id=scope_ids.__contains__))
+        return BeautifulSoup(html_content, 'html.parser')
+    raise ValueError(f"Backend d'analyse inconnu: {backend}")
@@ -0,0 +1,241 @@
+"""
+Mesures de temps du scraper, par requête et par domaine.
+
+Chaque appel à get_price ouvre une mesure (RequestSpan) attachée au thread courant:
+connexion (DNS + TCP, puis TLS) mesurée par des connexions urllib3 instrumentées,
+temps jusqu'au premier octet, téléchargement (octets et durée), analyse HTML,
+résultat du cache et nombre de tentatives. RunMetrics agrège ces mesures par domaine
+(p50/p95/p99) et les écrit dans un rapport JSON d'exécution à côté des logs.
+"""
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+_local = threading.local()
+
+# Correspondance entre la source d'un résultat de get_price et l'état du cache
+CACHE_STATES = {
+    'cache': 'hit',
+    'stale': 'stale',
+    'revalidated': 'revalidated',
+    'live': 'miss',
+    'error': 'miss',
+}
+
+
+class RequestSpan:
+    """Durées (en millisecondes) et compteurs d'un appel à get_price."""
+
+    def __init__(self, url):
+        self.url = url
+        self.domain = urlparse(url).netloc.lower()
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.cache = None
+        self.attempts = 0
+        self.bytes = 0
+        self.status = None
+
+    def add(self, name, milliseconds):
+        """Ajoute une durée à une étape (les étapes répétées par les réessais se cumulent)."""
+        self.timings[name] = self.timings.get(name, 0.0) + milliseconds
+
+    @contextmanager
+    def timed(self, name):
+        """Mesure la durée du bloc et l'ajoute à l'étape name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def finish(self, result):
+        """Termine la mesure avec le résultat de get_price."""
+        self.timings['total_ms'] = (time.perf_counter() - self.started) * 1000
+        self.status = result.get('status')
+        self.cache = CACHE_STATES.get(result.get('source'), 'miss')
+
+    def as_dict(self):
+        return {
+            'url': self.url,
+            'domain': self.domain,
+            'status': self.status,
+            'cache': self.cache,
+            'attempts': self.attempts,
+            'retries': max(0, self.attempts - 1),
+            'bytes': self.bytes,
+            **{name: round(value, 2) for name, value in self.timings.items()},
+        }
+
+
+def current_span():
+    """Retourne la mesure en cours dans ce thread, ou None."""
+    return getattr(_local, 'span', None)
+
+
+def percentile(sorted_values, fraction):
+    """Percentile par rang le plus proche sur une liste déjà triée."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class RunMetrics:
+    """Collecte les mesures d'une exécution et produit le rapport par domaine."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Repart d'une collecte vide (début d'exécution)."""
+        with self._lock:
+            self._spans = []
+            self._observations = {}
+            self._started = time.time()
+
+    @contextmanager
+    def span(self, url):
+        """Ouvre une mesure pour url, accessible dans le thread via current_span()."""
+        span = RequestSpan(url)
+        previous = current_span()
+        _local.span = span
+        try:
+            yield span
+        finally:
+            _local.span = previous
+            if span.status is not None:
+                with self._lock:
+                    self._spans.append(span)
+
+    def observe(self, domain, name, milliseconds):
+        """Enregistre une durée hors requête HTTP (écriture CSV, notifications...)."""
+        with self._lock:
+            self._observations.setdefault(domain, {}).setdefault(name, []).append(milliseconds)
+
+    def report(self):
+        """
+        Agrège les mesures par domaine.
+
+        Returns:
+            dict: Pour chaque domaine, le nombre de requêtes, les états du cache, les réessais,
+                  les octets téléchargés et p50/p95/p99 de chaque étape
+        """
+        with self._lock:
+            spans = list(self._spans)
+            observations = {domain: {name: list(values) for name, values in metrics.items()}
+                            for domain, metrics in self._observations.items()}
+            started = self._started
+
+        domains = {}
+        for span in spans:
+            stats = domains.setdefault(span.domain, {
+                'requests': 0, 'cache': {}, 'statuses': {}, 'retries': 0, 'bytes': 0, 'values': {},
+            })
+            stats['requests'] += 1
+            stats['cache'][span.cache] = stats['cache'].get(span.cache, 0) + 1
+            stats['statuses'][span.status] = stats['statuses'].get(span.status, 0) + 1
+            stats['retries'] += max(0, span.attempts - 1)
+            stats['bytes'] += span.bytes
+            for name, value in span.timings.items():
+                stats['values'].setdefault(name, []).append(value)
+        for domain, metrics in observations.items():
+            stats = domains.setdefault(domain, {
+                'requests': 0, 'cache': {}, 'statuses': {}, 'retries': 0, 'bytes': 0, 'values': {},
+            })
+            for name, values in metrics.items():
+                stats['values'].setdefault(name, []).extend(values)
+
+        for stats in domains.values():
+            histograms = {}
+            for name, values in sorted(stats.pop('values').items()):
+                values.sort()
+                histograms[name] = {
+                    'count': len(values),
+                    'p50': round(percentile(values, 0.50), 2),
+                    'p95': round(percentile(values, 0.95), 2),
+                    'p99': round(percentile(values, 0.99), 2),
+                    'max': round(values[-1], 2),
+                }
+            stats['timings_ms'] = histograms
+
+        return {
+            'started_at': datetime.fromtimestamp(started).isoformat(timespec='seconds'),
+            'duration_s': round(time.time() - started, 2),
+            'requests': len(spans),
+            'domains': domains,
+            'spans': [span.as_dict() for span in spans],
+        }
+
+    def write_report(self, logs_dir):
+        """Écrit le rapport JSON de l'exécution dans logs_dir et retourne son chemin."""
+        os.makedirs(logs_dir, exist_ok=True)
+        path = os.path.join(logs_dir, f"run_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False)
+        return path
+
+
+# --- Connexions urllib3 instrumentées ------------------------------------
+
+class _TimedConnectionMixin:
+    """Mesure l'établissement des connexions: DNS + TCP (_new_conn), puis TLS (reste de connect)."""
+
+    def _new_conn(self):
+        start = time.perf_counter()
+        try:
+            return super()._new_conn()
+        finally:
+            span = current_span()
+            if span is not None:
+                span.add('connect_ms', (time.perf_counter() - start) * 1000)
+
+    def connect(self):
+        start = time.perf_counter()
+        span = current_span()
+        before = span.timings.get('connect_ms', 0.0) if span is not None else 0.0
+        try:
+            return super().connect()
+        finally:
+            if span is not None:
+                tcp = span.timings.get('connect_ms', 0.0) - before
+                tls = (time.perf_counter() - start) * 1000 - tcp
+                if isinstance(self, HTTPSConnection):
+                    span.add('tls_ms', tls)
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter dont les connexions rapportent leur temps d'établissement à la mesure en cours."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
@@ -0,0 +1,84 @@
+"""
+Pool de processus pour l'analyse HTML.
+EcommerceParser.parse_page est du Python pur qui garde le GIL: dans un pool de threads,
+l'analyse de pages de 1 Mo se fait un cœur à la fois. ParsePool confie le HTML à des
+processus dont les imports (BeautifulSoup, lxml, sélecteurs précompilés) sont chargés
+une fois au démarrage, pour que l'analyse se fasse en parallèle des téléchargements
+et sur tous les cœurs disponibles.
+Les processus sont tous démarrés à la création du pool, avant les threads du scraper:
+un enfant créé par fork depuis un thread pourrait hériter d'un verrou tenu par un autre
+thread (template_cache, compilation des sélecteurs) et rester bloqué.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger('parse_pool')
+
+# En dessous de cette taille, l'envoi au pool coûte plus que l'analyse elle-même
+MIN_OFFLOAD_SIZE = 64 * 1024
+
+# Durée maximale d'attente d'une analyse dans le pool avant de la refaire localement (secondes)
+PARSE_TIMEOUT = 60
+
+
+def available_cores():
+    """Nombre de cœurs utilisables par ce processus."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _warm_worker(backend):
+    """Initialise un processus d'analyse: imports et premier passage sur une page minimale."""
+    from scripts.ecommerce_parser import EcommerceParser
+    EcommerceParser.parse_page('<html><body></body></html>', 'https://www.example.com/', None, backend=backend)
+
+
+def _parse_in_worker(html_content, url, css_selector, backend):
+    from scripts.ecommerce_parser import EcommerceParser
+    return EcommerceParser.parse_page(html_content, url, css_selector, backend=backend)
+
+
+class ParsePool:
+    """
+    Processus d'analyse HTML; retombe sur une analyse locale si le pool devient inutilisable
+    ou ne répond pas. À créer avant de lancer les threads qui l'utilisent.
+    """
+
+    def __init__(self, workers, backend):
+        """
+        Args:
+            workers (int): Nombre de processus d'analyse
+            backend (str): Backend d'analyse HTML des processus ('html.parser' ou 'lxml')
+        """
+        self.workers = workers
+        self.backend = backend
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker, initargs=(backend,))
+        self._broken = False
+        # Démarre les processus maintenant, depuis le thread appelant, plutôt qu'au premier
+        # envoi depuis un thread de récupération
+        try:
+            self._executor.submit(os.getpid).result(timeout=PARSE_TIMEOUT)
+        except (BrokenProcessPool, TimeoutError) as e:
+            logger.error(f"Démarrage du pool d'analyse impossible, analyse dans le processus principal: {e}")
+            self._broken = True
+
+    def parse(self, html_content, url, css_selector):
+        """Analyse une page dans un processus du pool (appel bloquant pour le thread appelant)."""
+        if not self._broken:
+            future = self._executor.submit(_parse_in_worker, html_content, url, css_selector, self.backend)
+            try:
+                return future.result(timeout=PARSE_TIMEOUT)
+            except TimeoutError:
+                future.cancel()
+                logger.warning(f"Analyse de {url} sans réponse du pool après {PARSE_TIMEOUT} s, analyse locale")
+            except BrokenProcessPool as e:
+                logger.error(f"Pool d'analyse inutilisable, analyse dans le processus principal: {e}")
+                self._broken = True
+        from scripts.ecommerce_parser import EcommerceParser
+        return EcommerceParser.parse_page(html_content, url, css_selector, backend=self.backend)
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
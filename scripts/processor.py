@@ -4,13 +4,15 @@ import logging
 import pandas as pd
 from datetime import datetime
 import sys
+import time
+from urllib.parse import urlparse
 
 # Add the parent directory to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Import other modules
 from scripts.notifier import notify_price_drop, notify_threshold_reached
-from scripts.scraper import get_price
+from scripts.scraper import get_price, get_prices_bulk, close_sessions, negative_cache, run_metrics, DEFAULT_MAX_CONCURRENCY
 from scripts.save_price import save_product_price
 
 # Configuration du logging
@@ -96,8 +98,13 @@ def check_price_changes(product_data, current_price):
             product_data.get('currency', '€')
         )
 
-def process_product(product_data):
-    """Traite un seul produit: scrape le prix, l'enregistre et vérifie les changements"""
+def process_product(product_data, result=None, mode='fresh'):
+    """
+    Traite un seul produit: scrape le prix, l'enregistre et vérifie les changements.
+    Si result est fourni (résultat déjà récupéré par get_prices_bulk), le scraping est ignoré.
+    En mode 'swr', un prix expiré du cache peut être renvoyé immédiatement: il n'est alors
+    ni enregistré dans l'historique ni notifié, le rafraîchissement se faisant en arrière-plan.
+    """
     try:
         product_id = product_data['id']
         product_name = product_data['name']
@@ -106,14 +113,21 @@ def process_product(product_data):
         
         logger.info(f"Traitement du produit: {product_name} (ID: {product_id})")
         
-        # Scrape le prix
-        result = get_price(url, css_selector)
+        # Scrape le prix si le résultat n'a pas déjà été récupéré
+        if result is None:
+            result = get_price(url, css_selector, mode=mode)
         
         # Ajoute l'URL au résultat
         result['url'] = url
         
+        if result.get('source') == 'stale':
+            logger.info(f"Prix en cache de {result['cache_age'] / 60:.0f} minutes pour {product_name}, non enregistré")
+            return result.get('numeric_price')
+        
         # Enregistre le prix
+        save_start = time.perf_counter()
         price_value = save_product_price(result, product_id)
+        run_metrics.observe(urlparse(url).netloc.lower(), 'save_ms', (time.perf_counter() - save_start) * 1000)
         
         # Vérifie les changements de prix et les notifications
         if price_value is not None:
@@ -124,8 +138,15 @@ def process_product(product_data):
         logger.error(f"Erreur lors du traitement du produit {product_data.get('name', 'Inconnu')}: {e}")
         return None
 
-def process_all_products():
-    """Traite tous les produits depuis le fichier de configuration"""
+def process_all_products(max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Traite tous les produits depuis le fichier de configuration.
+    Les pages sont récupérées en parallèle, puis les prix sont enregistrés
+    séquentiellement pour ne pas entrelacer les écritures CSV.
+    Les produits en échec durable (page disparue, aucun prix) dont la prochaine
+    vérification n'est pas encore due sont ignorés et listés dans un rapport.
+    Les durées de chaque étape sont écrites dans un rapport JSON dans logs/.
+    """
     products = load_products()
     
     if not products:
@@ -133,20 +154,69 @@ def process_all_products():
         return
     
     logger.info(f"Démarrage du suivi des prix pour {len(products)} produits")
+    run_metrics.reset()
+    
+    # Écarte les URL en échec durable qui ne sont pas encore à revérifier
+    due = []
+    skipped = {}
+    for product in products:
+        entry = negative_cache.should_skip(product['url'])
+        if entry is None:
+            due.append(product)
+        else:
+            skipped[product['id']] = entry
+    if skipped:
+        report_skipped_products(products, skipped)
+    
+    # Récupère toutes les pages en parallèle, puis libère les connexions persistantes
+    try:
+        scraped = get_prices_bulk(due, max_concurrency=max_concurrency, stream=True)
+    finally:
+        close_sessions()
+    scraped_by_id = {product['id']: result for product, result in zip(due, scraped)}
     
     results = []
     for product in products:
-        price = process_product(product)
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if product['id'] in skipped:
+            results.append({
+                'id': product['id'],
+                'name': product['name'],
+                'price': None,
+                'status': 'skipped',
+                'failure': skipped[product['id']]['failure'],
+                'timestamp': timestamp
+            })
+            continue
+        scraped_result = scraped_by_id[product['id']]
+        price = process_product(product, scraped_result)
         results.append({
             'id': product['id'],
             'name': product['name'],
             'price': price,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'status': scraped_result.get('status'),
+            'timestamp': timestamp
         })
     
     logger.info(f"Suivi des prix terminé pour {len(products)} produits")
+    try:
+        report_path = run_metrics.write_report(os.path.join(BASE_DIR, 'logs'))
+        logger.info(f"Rapport de performance enregistré: {report_path}")
+    except OSError as e:
+        logger.warning(f"Impossible d'écrire le rapport de performance: {e}")
     return results
 
+def report_skipped_products(products, skipped):
+    """Journalise les produits ignorés car en échec durable, avec la date de leur prochaine vérification."""
+    logger.warning(f"{len(skipped)} produits en échec durable ignorés lors de cette exécution:")
+    for product in products:
+        entry = skipped.get(product['id'])
+        if entry is None:
+            continue
+        next_check = datetime.fromtimestamp(entry['next_check']).strftime('%Y-%m-%d %H:%M')
+        logger.warning(f"  - {product['name']} ({entry['failure']}, {entry['failures']} échec(s)), "
+                       f"prochaine vérification le {next_check}: {product['url']}")
+
 if __name__ == "__main__":
     # Crée les répertoires requis
     os.makedirs(os.path.join(BASE_DIR, 'logs'), exist_ok=True)
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Enregistrement et rejeu de réponses HTTP pour mesurer le scraper sans solliciter les sites.
+
+FixtureStore conserve des réponses réelles (statut, en-têtes, corps) par URL canonique.
+ReplayServer les rejoue localement, avec latence, limitation de débit (429 + Retry-After)
+et injection d'erreurs configurables. Le serveur accepte les requêtes directes comme les
+requêtes de proxy HTTP: en définissant HTTP_PROXY, le scraper garde les vraies URL (et
+donc la détection du site) tout en étant servi par le serveur local.
+
+Utilisation:
+    python scripts/replay.py record URL [URL ...] [--fixtures DIR]
+    python scripts/replay.py seed [--fixtures DIR]
+    python scripts/replay.py serve [--port 8800] [--latency 50] [--error-rate 0.05] [--rate-limit 5]
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+# Ajoute le répertoire parent au sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.cache import CACHE_DIR, PageCache
+from scripts.urls import canonical_url
+from scripts.user_agents import get_random_user_agent
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(BASE_DIR, 'fixtures')
+
+# En-têtes de réponse qui ne doivent pas être rejoués tels quels
+_SKIPPED_HEADERS = {'content-length', 'content-encoding', 'transfer-encoding', 'connection', 'keep-alive'}
+
+# Chemin d'accès direct à une fixture: /replay/<clé>[/<suffixe>]
+_REPLAY_PATH_RE = re.compile(r'^/replay/([0-9a-f]{64})(?:/[^?]*)?$')
+
+
+def fixture_key(url):
+    """Clé d'une fixture: SHA-256 de l'URL canonique, indépendamment du schéma http/https."""
+    parts = urlsplit(canonical_url(url))
+    return hashlib.sha256(urlunsplit(('https',) + tuple(parts[1:])).encode('utf-8')).hexdigest()
+
+
+class FixtureStore:
+    """Réponses enregistrées: <clé>.json (URL, statut, en-têtes) et <clé>.body (corps brut)."""
+
+    def __init__(self, directory=FIXTURES_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return f"{base}.json", f"{base}.body"
+
+    def save(self, url, status, headers, body):
+        """Enregistre une réponse et retourne sa clé."""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        key = fixture_key(url)
+        meta_path, body_path = self._paths(key)
+        with open(body_path, 'wb') as f:
+            f.write(body)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'url': canonical_url(url),
+                'status': status,
+                'headers': {k: v for k, v in dict(headers or {}).items() if k.lower() not in _SKIPPED_HEADERS},
+                'recorded_at': time.time(),
+            }, f, indent=1, ensure_ascii=False)
+        return key
+
+    def load(self, key):
+        """Retourne (métadonnées, corps) pour une clé, ou None."""
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                return meta, f.read()
+        except FileNotFoundError:
+            return None
+
+    def entries(self):
+        """Liste des fixtures: tuples (clé, métadonnées)."""
+        entries = []
+        for meta_path in sorted(glob.glob(os.path.join(self.directory, '*.json'))):
+            key = os.path.splitext(os.path.basename(meta_path))[0]
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                entries.append((key, json.load(f)))
+        return entries
+
+
+def record(urls, store):
+    """Télécharge les URL et enregistre les réponses réelles dans le store."""
+    session = requests.Session()
+    recorded = 0
+    for url in urls:
+        try:
+            response = session.get(url, headers={
+                "User-Agent": get_random_user_agent(),
+                "Accept-Language": "fr-FR,fr;q=0.9,en-US;q=0.8,en;q=0.7",
+            }, timeout=30)
+        except requests.exceptions.RequestException as e:
+            print(f"Échec de l'enregistrement de {url}: {e}")
+            continue
+        key = store.save(url, response.status_code, response.headers, response.content)
+        print(f"{response.status_code} {len(response.content):>9} octets  {key[:12]}  {url}")
+        recorded += 1
+    return recorded
+
+
+def seed_from_cache(store, cache_dir=CACHE_DIR):
+    """
+    Alimente le store avec les pages du cache du scraper. Les anciens fichiers
+    domaine_hash.html n'ont pas d'URL complète: une URL /legacy/<fichier> du domaine est utilisée.
+    """
+    seeded = 0
+    index_file = os.path.join(cache_dir, PageCache.INDEX_NAME)
+    if os.path.exists(index_file):
+        with open(index_file, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        for key, entry in index.items():
+            path = os.path.join(cache_dir, PageCache.PAGES_NAME, f"{key}.html")
+            if entry.get('partial') or not os.path.exists(path):
+                continue
+            headers = {'Content-Type': 'text/html; charset=utf-8'}
+            if entry.get('etag'):
+                headers['ETag'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['Last-Modified'] = entry['last_modified']
+            with open(path, 'rb') as f:
+                store.save(entry['url'], 200, headers, f.read())
+            seeded += 1
+    for path in sorted(glob.glob(os.path.join(cache_dir, '*.html'))):
+        name = os.path.basename(path)
+        domain = name.rsplit('_', 1)[0]
+        with open(path, 'rb') as f:
+            store.save(f"https://{domain}/legacy/{name}", 200, {'Content-Type': 'text/html; charset=utf-8'}, f.read())
+        seeded += 1
+    return seeded
+
+
+class _ReplayHTTPServer(ThreadingHTTPServer):
+    """Serveur HTTP du rejeu, silencieux quand un client coupe la connexion en cours de réponse."""
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # La lecture en flux du scraper ferme la connexion dès que les champs sont extraits
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class ReplayServer:
+    """
+    Serveur HTTP local qui rejoue les fixtures d'un FixtureStore.
+
+    Args:
+        store (FixtureStore): Réponses à rejouer
+        latency (float): Latence ajoutée à chaque réponse, en secondes
+        jitter (float): Variation aléatoire de la latence (+/-), en secondes
+        rate_limit (float): Requêtes par seconde acceptées par hôte avant de répondre 429, ou None
+        error_rate (float): Proportion de réponses remplacées par une erreur
+        error_status (int): Statut HTTP des erreurs injectées
+    """
+
+    def __init__(self, store, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 rate_limit=None, error_rate=0.0, error_status=503):
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stats = {'requests': 0, 'served': 0, 'not_modified': 0, 'throttled': 0, 'errors': 0, 'missing': 0}
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._httpd = _ReplayHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='replay-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _throttled(self, host):
+        """Fenêtre glissante d'une seconde par hôte."""
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            window = [t for t in self._windows.get(host, []) if now - t < 1.0]
+            throttled = len(window) >= self.rate_limit
+            if not throttled:
+                window.append(now)
+            self._windows[host] = window
+        return throttled
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, headers, body=b''):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if body and self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                server._count('requests')
+                # Requête de proxy (URL absolue) ou requête directe
+                if self.path.startswith('/'):
+                    host = self.headers.get('Host', '')
+                    url = f"http://{host}{self.path}"
+                else:
+                    url = self.path
+                    host = urlsplit(url).netloc
+                path = urlsplit(url).path
+
+                delay = server.latency + random.uniform(-server.jitter, server.jitter)
+                if delay > 0:
+                    time.sleep(delay)
+
+                if server._throttled(host.lower()):
+                    server._count('throttled')
+                    return self._send(429, {'Retry-After': '1', 'Content-Type': 'text/plain'}, b'Too Many Requests')
+                if server.error_rate and random.random() < server.error_rate:
+                    server._count('errors')
+                    return self._send(server.error_status, {'Content-Type': 'text/plain'}, b'Injected error')
+
+                match = _REPLAY_PATH_RE.match(path)
+                fixture = server.store.load(match.group(1) if match else fixture_key(url))
+                if fixture is None:
+                    server._count('missing')
+                    return self._send(404, {'Content-Type': 'text/plain'}, b'No fixture')
+                meta, body = fixture
+                etag = meta['headers'].get('ETag')
+                if etag and self.headers.get('If-None-Match') == etag:
+                    server._count('not_modified')
+                    return self._send(304, {'ETag': etag})
+                server._count('served')
+                self._send(meta['status'], meta['headers'], body)
+
+            do_HEAD = do_GET
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Enregistrement et rejeu de réponses HTTP pour le scraper')
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='Répertoire des fixtures')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record_cmd = subparsers.add_parser('record', help='Enregistre les réponses réelles des URL données')
+    record_cmd.add_argument('urls', nargs='+', help='URL à enregistrer')
+
+    subparsers.add_parser('seed', help='Importe les pages du cache du scraper')
+
+    serve_cmd = subparsers.add_parser('serve', help='Rejoue les fixtures sur un serveur local')
+    serve_cmd.add_argument('--port', type=int, default=8800)
+    serve_cmd.add_argument('--latency', type=float, default=0.0, help='Latence ajoutée, en millisecondes')
+    serve_cmd.add_argument('--jitter', type=float, default=0.0, help='Variation de latence, en millisecondes')
+    serve_cmd.add_argument('--rate-limit', type=float, default=None, help='Requêtes/s par hôte avant 429')
+    serve_cmd.add_argument('--error-rate', type=float, default=0.0, help="Proportion d'erreurs injectées")
+    serve_cmd.add_argument('--error-status', type=int, default=503, help='Statut des erreurs injectées')
+
+    args = parser.parse_args()
+    store = FixtureStore(args.fixtures)
+
+    if args.command == 'record':
+        print(f"{record(args.urls, store)} réponses enregistrées dans {store.directory}")
+    elif args.command == 'seed':
+        print(f"{seed_from_cache(store)} pages du cache importées dans {store.directory}")
+    elif args.command == 'serve':
+        server = ReplayServer(store, port=args.port, latency=args.latency / 1000, jitter=args.jitter / 1000,
+                              rate_limit=args.rate_limit, error_rate=args.error_rate,
+                              error_status=args.error_status)
+        server.start()
+        print(f"{len(store.entries())} fixtures rejouées sur {server.address} "
+              f"(HTTP_PROXY={server.address} pour les URL http://)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,9 +6,24 @@ import logging
 import time
 import random
 import os
+import atexit
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from urllib.parse import urlparse
 from scripts.user_agents import get_random_user_agent
 from scripts.ecommerce_parser import EcommerceParser
+from scripts.cache import PageCache, NegativeCache
+from scripts.urls import canonical_url
+from scripts.sites import site_registry
+from scripts.selector_stats import selector_stats
+from scripts.templates import template_cache
+from scripts.metrics import RunMetrics, TimedHTTPAdapter, current_span
+from scripts.parse_pool import ParsePool, MIN_OFFLOAD_SIZE, available_cores
+from scripts.bot_detection import detect_block_page
+from scripts.throttle import (
+    DomainBackoff, DomainRateLimiter, AdaptiveConcurrency, CircuitBreaker, CONGESTION_STATUSES, parse_retry_after
+)
 
 # Configure logging
 logging.basicConfig(
@@ -17,62 +32,350 @@ logging.basicConfig(
 )
 logger = logging.getLogger('price_scraper')
 
-# Create a cache directory if it doesn't exist
-CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache')
-os.makedirs(CACHE_DIR, exist_ok=True)
+# Cache disque partagé entre le worker Airflow, la CLI et le tableau de bord
+page_cache = PageCache()
+atexit.register(page_cache.flush)
+atexit.register(selector_stats.flush)
+atexit.register(template_cache.flush)
+
+# Mesures de temps par requête et par domaine de l'exécution en cours
+run_metrics = RunMetrics()
+
+# URL en échec durable (404/410, aucun prix), revérifiées à intervalles croissants
+negative_cache = NegativeCache()
+
+# Pause par domaine après une page de blocage, partagée par tous les workers
+domain_backoff = DomainBackoff()
+
+# Débit maximal par domaine (requêtes par seconde) et rafale autorisée
+RATE_LIMIT = float(os.environ.get('PRICE_TRACKER_RATE_LIMIT', '0.5'))
+RATE_BURST = int(os.environ.get('PRICE_TRACKER_RATE_BURST', '2'))
+
+# Créneaux de requête par domaine, partagés par tous les workers;
+# les sites dont le profil définit une politique de récupération ont leur propre limite
+rate_limiter = DomainRateLimiter(rate=RATE_LIMIT, burst=RATE_BURST, limits={
+    domain: (profile.rate, profile.burst or 1)
+    for profile in site_registry.profiles() if profile.rate
+    for domain in profile.domains
+})
+
+# Requêtes simultanées par domaine, ajustées selon les réponses (AIMD)
+MAX_DOMAIN_CONCURRENCY = int(os.environ.get('PRICE_TRACKER_MAX_DOMAIN_CONCURRENCY', '8'))
+domain_concurrency = AdaptiveConcurrency(maximum=MAX_DOMAIN_CONCURRENCY)
+
+# Disjoncteur par domaine: échecs consécutifs avant ouverture et durée d'ouverture (secondes)
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('PRICE_TRACKER_CIRCUIT_THRESHOLD', '5'))
+CIRCUIT_COOLDOWN = float(os.environ.get('PRICE_TRACKER_CIRCUIT_COOLDOWN', '300'))
+circuit_breaker = CircuitBreaker(failure_threshold=CIRCUIT_FAILURE_THRESHOLD, cooldown=CIRCUIT_COOLDOWN)
+
+# Backend d'analyse HTML: 'html.parser' (BeautifulSoup) ou 'lxml'
+PARSER_BACKEND = os.environ.get('PRICE_TRACKER_PARSER_BACKEND', 'html.parser')
+
+# Nombre de requêtes simultanées par défaut pour le scraping en masse
+DEFAULT_MAX_CONCURRENCY = 8
 
-def get_price(url, css_selector, retries=3, delay=2, use_cache=True, cache_duration=3600):
+# Processus d'analyse HTML du scraping en masse (1 = analyse dans les threads de récupération)
+DEFAULT_PARSE_WORKERS = int(os.environ.get('PRICE_TRACKER_PARSE_WORKERS', '0')) or available_cores()
+
+# Pool d'analyse actif pendant get_prices_bulk, None sinon
+_parse_pool = None
+
+# Issues de la lecture directe du HTML par site ('hit', 'validated', 'mismatch', 'miss')
+scan_stats = {}
+_scan_stats_lock = threading.Lock()
+
+# Lecture en flux: taille des blocs et marge lue après le dernier marqueur de champ
+STREAM_CHUNK_SIZE = 16 * 1024
+STREAM_MARGIN = 32 * 1024
+
+class SessionManager:
+    """
+    Pool de sessions HTTP persistantes, une par domaine.
+    Chaque session garde ses connexions ouvertes (keep-alive) pendant toute l'exécution,
+    ce qui évite de refaire la résolution DNS et les poignées de main TCP/TLS à chaque produit.
+    Les sessions sont créées à la demande et peuvent être partagées entre threads.
     """
-    Récupère le prix depuis un site web en utilisant le sélecteur CSS fourni.
-    Inclut la logique de réessai, des délais aléatoires et la mise en cache pour éviter d'être bloqué.
     
-    Args:
-        url (str): L'URL de la page du produit
-        css_selector (str): Sélecteur CSS pour l'élément de prix
-        retries (int): Nombre de tentatives de réessai
-        delay (int): Délai de base entre les réessais en secondes
-        use_cache (bool): Utiliser ou non les réponses mises en cache
-        cache_duration (int): Durée de validité du cache en secondes
+    def __init__(self, pool_connections=2, pool_maxsize=DEFAULT_MAX_CONCURRENCY):
+        """
+        Args:
+            pool_connections (int): Nombre de pools d'hôtes conservés par session
+            pool_maxsize (int): Nombre de connexions gardées ouvertes par hôte
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._sessions = {}
+        self._lock = threading.Lock()
+    
+    def _create_session(self):
+        session = requests.Session()
+        # Les réessais sont gérés par get_price, pas par urllib3;
+        # les connexions instrumentées mesurent DNS + TCP et TLS pour run_metrics
+        adapter = TimedHTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=0,
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+    
+    def get_session(self, url):
+        """Retourne la session associée au domaine de l'URL, en la créant si nécessaire."""
+        domain = urlparse(url).netloc.lower()
+        with self._lock:
+            session = self._sessions.get(domain)
+            if session is None:
+                session = self._create_session()
+                self._sessions[domain] = session
+                logger.debug(f"Nouvelle session HTTP pour {domain}")
+            return session
+    
+    def close(self):
+        """Ferme toutes les sessions et leurs connexions."""
+        with self._lock:
+            sessions = list(self._sessions.items())
+            self._sessions.clear()
+        for domain, session in sessions:
+            try:
+                session.close()
+            except Exception as e:
+                logger.warning(f"Erreur lors de la fermeture de la session {domain}: {e}")
+        if sessions:
+            logger.info(f"{len(sessions)} sessions HTTP fermées")
+
+# Sessions partagées par tous les appels à get_price d'une même exécution
+session_manager = SessionManager()
+
+def close_sessions():
+    """Ferme les connexions HTTP persistantes ouvertes pendant l'exécution."""
+    session_manager.close()
+
+def get_run_summary():
+    """
+    Retourne l'état de la régulation par domaine pour l'exécution en cours:
+    disjoncteurs, pauses après blocage et limites de concurrence, ainsi que les
+    taux de réussite des sélecteurs, l'usage des gabarits de pages et les issues de la
+    lecture directe du HTML par site.
+    """
+    return {
+        "circuit_breakers": circuit_breaker.snapshot(),
+        "blocked_domains": domain_backoff.snapshot(),
+        "concurrency": domain_concurrency.snapshot(),
+        "negative_cache": negative_cache.report(),
+        "selectors": selector_stats.report(),
+        "templates": template_cache.report(),
+        "scan": {site: dict(counts) for site, counts in scan_stats.items()},
+    }
+
+def _build_result(result, url, source):
+    """Convertit un résultat de EcommerceParser.parse_page au format attendu par le reste de l'application."""
+    return {
+        "price": result["price_text"],
+        "title": result["title"],
+        "currency": result["currency"],
+        "status": "success" if result["price_text"] else "error",
+        "numeric_price": result["numeric_price"],
+        "availability": result["availability"],
+        "image_url": result["image_url"],
+        "url": url,
+        "source": source
+    }
+
+def _parse_page(html_content, url, css_selector):
+    pool = _parse_pool
+    if pool is not None and len(html_content) >= MIN_OFFLOAD_SIZE:
+        # Le thread attend sans garder le GIL: les autres continuent de télécharger
+        return pool.parse(html_content, url, css_selector)
+    return EcommerceParser.parse_page(html_content, url, css_selector, backend=PARSER_BACKEND)
+
+def _record_parse(result):
+    """
+    Enregistre les sélecteurs retenus par une analyse du DOM (selector_stats), l'usage
+    du gabarit de la page (template_cache) et l'issue de la lecture directe (scan_stats),
+    y compris pour une analyse faite dans le pool.
+    """
+    if result.get("scan"):
+        with _scan_stats_lock:
+            counts = scan_stats.setdefault(result["site"], {})
+            counts[result["scan"]] = counts.get(result["scan"], 0) + 1
+    if result.get("selectors"):
+        # Les sélecteurs personnalisés sont propres à chaque produit: seuls ceux du site sont suivis
+        selector_stats.record(result["site"], {
+            field: selector for field, selector in result["selectors"].items() if field != "custom_price"
+        })
+    if result.get("template"):
+        template_cache.record(result["site"], result["template"])
+        span = current_span()
+        if span is not None:
+            span.add('extract_ms', result["template"]["extract_ms"])
+
+def _parse(html_content, url, css_selector, record=True):
+    """
+    Analyse une page avec EcommerceParser en comptant le temps d'analyse dans la mesure en cours.
+    Pendant get_prices_bulk, les pages volumineuses sont analysées dans le pool de processus.
+    Les sélecteurs retenus sont enregistrés dans selector_stats, sauf si record est faux.
+    """
+    span = current_span()
+    if span is None:
+        result = _parse_page(html_content, url, css_selector)
+    else:
+        with span.timed('parse_ms'):
+            result = _parse_page(html_content, url, css_selector)
+    if record:
+        _record_parse(result)
+    return result
+
+def _custom_price_found(result, css_selector):
+    """
+    Indique si le prix d'un résultat vient du sélecteur personnalisé du produit (toujours vrai
+    sans sélecteur personnalisé). Un résultat sans sélecteurs ne vient pas du DOM: la lecture
+    directe n'est faite pour un sélecteur personnalisé que s'il est celui qu'elle reproduit.
+    """
+    if css_selector in (None, "", "auto") or "selectors" not in result:
+        return True
+    return result["selectors"].get("custom_price") is not None
+
+def _read_streaming(response, url, css_selector):
+    """
+    Lit une réponse ouverte avec stream=True par blocs et ferme la connexion dès que
+    tous les champs de la page ont été extraits, sans télécharger la fin du document.
+    
+    Les marqueurs d'octets de chaque champ (EcommerceParser.get_stream_markers) sont
+    recherchés au fil de la lecture; une fois tous vus (plus une marge), le début du
+    document est analysé. Si le prix ou le titre manque, ou si le prix ne vient pas du
+    sélecteur personnalisé du produit, la lecture continue jusqu'au bout.
     
     Returns:
-        dict: Informations sur le produit incluant le prix, le titre, etc.
+        tuple: (html, résultat de parse_page ou None si la page a été lue en entier, infos de lecture)
     """
-    # Générer un nom de fichier de cache basé sur l'URL
-    cache_file = None
-    if use_cache:
-        parsed_url = urlparse(url)
-        domain = parsed_url.netloc
-        path_hash = hash(parsed_url.path)
-        cache_file = os.path.join(CACHE_DIR, f"{domain}_{path_hash}.html")
-        
-        # Vérifier si nous avons une réponse en cache valide
-        if os.path.exists(cache_file):
-            file_age = time.time() - os.path.getmtime(cache_file)
-            if file_age < cache_duration:
-                logger.info(f"Utilisation de la réponse en cache pour {url}")
-                try:
-                    with open(cache_file, 'r', encoding='utf-8') as f:
-                        html_content = f.read()
-                    
-                    # Analyser le HTML en cache
-                    result = EcommerceParser.parse_page(html_content, url, css_selector)
-                    
-                    # S'assurer d'avoir tous les champs attendus par le reste de l'application
-                    return {
-                        "price": result["price_text"],
-                        "title": result["title"],
-                        "currency": result["currency"],
-                        "status": "success" if result["price_text"] else "error",
-                        "numeric_price": result["numeric_price"],
-                        "availability": result["availability"],
-                        "image_url": result["image_url"],
-                        "url": url,
-                        "source": "cache"
-                    }
-                except Exception as e:
-                    logger.warning(f"Erreur lors de l'utilisation de la réponse en cache: {e}")
-                    # Continuer avec une nouvelle requête si le cache échoue
+    site = EcommerceParser.detect_site(url)
+    pending = dict(EcommerceParser.get_stream_markers(site, css_selector))
+    overlap = max((len(marker) for marker in pending.values()), default=0)
+    encoding = response.encoding or 'utf-8'
+    buffer = bytearray()
+    scan_from = 0
+    stop_at = None
+    result = None
+    try:
+        for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+            buffer += chunk
+            if pending:
+                # Recherche dans le nouveau bloc, avec un recouvrement pour les marqueurs à cheval
+                window_start = max(0, scan_from - overlap)
+                for field, marker in list(pending.items()):
+                    if buffer.find(marker, window_start) != -1:
+                        del pending[field]
+                scan_from = len(buffer)
+                if not pending:
+                    stop_at = len(buffer) + STREAM_MARGIN
+            elif stop_at is not None and len(buffer) >= stop_at:
+                candidate = _parse(buffer.decode(encoding, errors='replace'), url, css_selector, record=False)
+                if (candidate["price_text"] and candidate["title"] != "Unknown Product"
+                        and _custom_price_found(candidate, css_selector)):
+                    _record_parse(candidate)
+                    result = candidate
+                    break
+                # Champs incomplets malgré les marqueurs: lire la page entière
+                stop_at = None
+        bytes_read = response.raw.tell() if response.raw is not None else len(buffer)
+    finally:
+        response.close()
+    
+    content_length = response.headers.get('Content-Length')
+    if result is None:
+        bytes_saved = 0
+    elif content_length and content_length.isdigit():
+        bytes_saved = max(0, int(content_length) - bytes_read)
+    else:
+        # Taille totale inconnue (transfert par blocs): l'économie ne peut pas être mesurée
+        bytes_saved = None
+    info = {
+        "bytes_read": bytes_read,
+        "bytes_saved": bytes_saved,
+        "truncated": result is not None,
+    }
+    return buffer.decode(encoding, errors='replace'), result, info
+
+def _revalidated_result(url, css_selector, response_headers):
+    """
+    Rafraîchit l'entrée de cache après une réponse 304 et retourne le résultat en cache,
+    ou None si ni l'extraction ni le HTML ne sont disponibles.
+    """
+    if not page_cache.revalidate(url, response_headers):
+        return None
+    result = page_cache.get_extraction(url, css_selector, EcommerceParser.extraction_version(url))
+    if result is None:
+        html_content = page_cache.get(url)
+        if html_content is None:
+            return None
+        result = _parse(html_content, url, css_selector)
+        page_cache.put_extraction(url, css_selector, EcommerceParser.extraction_version(url), result)
+    return _build_result(result, url, "revalidated")
+
+def _error_result(url, message, status="error"):
+    """Résultat renvoyé quand aucun prix n'a pu être obtenu."""
+    return {
+        "price": None,
+        "title": "Produit Inconnu",
+        "currency": "Inconnu",
+        "status": status,
+        "message": message,
+        "url": url,
+        "source": "error"
+    }
+
+def _cached_result(url, css_selector, cache_duration):
+    """
+    Cherche le résultat dans le cache: extraction déjà calculée, sinon HTML à ré-analyser.
+    Retourne None si la page doit être récupérée.
+    """
+    # Premier niveau: résultat d'extraction déjà calculé pour cette page
+    result = page_cache.get_extraction(url, css_selector, EcommerceParser.extraction_version(url), max_age=cache_duration)
+    if result is not None:
+        logger.info(f"Utilisation de l'extraction en cache pour {url}")
+        return _build_result(result, url, "cache")
     
+    # Second niveau: HTML en cache, à ré-analyser
+    html_content = page_cache.get(url, max_age=cache_duration)
+    if html_content is not None and detect_block_page(html_content):
+        # Page de blocage enregistrée par une version précédente: l'écarter
+        page_cache.delete(url)
+        html_content = None
+    if html_content is not None:
+        logger.info(f"Utilisation de la réponse en cache pour {url}")
+        try:
+            # Analyser le HTML en cache
+            result = _parse(html_content, url, css_selector)
+            page_cache.put_extraction(url, css_selector, EcommerceParser.extraction_version(url), result)
+            return _build_result(result, url, "cache")
+        except Exception as e:
+            logger.warning(f"Erreur lors de l'utilisation de la réponse en cache: {e}")
+            # Continuer avec une nouvelle requête si le cache échoue
+    return None
+
+def _timed_get(session, url, headers, stream, span):
+    """
+    Envoie la requête GET en enregistrant dans la mesure en cours le temps jusqu'au premier
+    octet (hors établissement de connexion) et, sans lecture en flux, le téléchargement du corps.
+    """
+    if span is None:
+        return session.get(url, headers=headers, timeout=30, stream=stream)
+    connect_before = span.timings.get('connect_ms', 0.0) + span.timings.get('tls_ms', 0.0)
+    start = time.perf_counter()
+    response = session.get(url, headers=headers, timeout=30, stream=stream)
+    total = (time.perf_counter() - start) * 1000
+    connect = span.timings.get('connect_ms', 0.0) + span.timings.get('tls_ms', 0.0) - connect_before
+    ttfb = response.elapsed.total_seconds() * 1000
+    span.add('ttfb_ms', max(0.0, ttfb - connect))
+    if not stream:
+        # requests a déjà lu le corps de la réponse
+        span.add('download_ms', max(0.0, total - ttfb))
+        span.bytes += len(response.content)
+    return response
+
+def _fetch_live(url, css_selector, retries, delay, use_cache, stream):
+    """Récupère et analyse la page sur le réseau (réessais, régulation par domaine, mise en cache)."""
     # Configuration des en-têtes avec un user agent aléatoire
     headers = {
         "User-Agent": get_random_user_agent(),
@@ -85,71 +388,396 @@ def get_price(url, css_selector, retries=3, delay=2, use_cache=True, cache_durat
         "Pragma": "no-cache",
     }
     
+    # Validateurs de la page en cache pour une requête conditionnelle (réponse 304 si inchangée)
+    conditional_headers = page_cache.conditional_headers(url) if use_cache else {}
+    domain = urlparse(url).netloc.lower()
+    retry_after = None
+    no_price = False
+    span = current_span()
+    
     for attempt in range(retries):
+        # Domaine en pause après un blocage: inutile de consommer les réessais
+        pause = domain_backoff.remaining(domain)
+        if pause > 0:
+            logger.warning(f"{domain} est en pause après un blocage ({pause:.0f} s restantes), {url} ignoré")
+            return _error_result(url, f"Domaine {domain} bloqué temporairement", status="blocked")
+        
+        # Domaine en panne: échouer immédiatement plutôt qu'attendre délais et réessais
+        if not circuit_breaker.allow(domain):
+            logger.warning(f"Circuit ouvert pour {domain}, {url} ignoré")
+            return _error_result(url, f"Circuit ouvert pour {domain} après des échecs répétés", status="circuit_open")
+        
+        slot_held = False
         try:
-            # Ajouter un délai aléatoire pour imiter un comportement humain
+            # Ajouter un délai aléatoire pour imiter un comportement humain,
+            # ou attendre le délai demandé par le serveur (Retry-After)
             if attempt > 0:
-                sleep_time = delay + random.uniform(1, 3)
+                sleep_time = retry_after if retry_after is not None else delay + random.uniform(1, 3)
+                retry_after = None
                 logger.info(f"Tentative {attempt+1}/{retries} - Attente de {sleep_time:.2f} secondes")
                 time.sleep(sleep_time)
             
             logger.info(f"Récupération du prix depuis: {url}")
-            response = requests.get(url, headers=headers, timeout=30)
+            session = session_manager.get_session(url)
+            domain_concurrency.acquire(domain)
+            slot_held = True
+            rate_limiter.acquire(domain)
+            if span is not None:
+                span.attempts = attempt + 1
+            response = _timed_get(session, url, {**headers, **conditional_headers}, stream, span)
+            
+            if response.status_code == 304:
+                response.close()
+                # Page inchangée: réutiliser l'extraction en cache sans télécharger ni analyser
+                cached = _revalidated_result(url, css_selector, response.headers)
+                if cached is not None:
+                    circuit_breaker.record_success(domain)
+                    logger.info(f"Page inchangée (304), extraction en cache réutilisée pour {url}")
+                    return cached
+                # Le cache ne permet pas de répondre: refaire une requête complète
+                conditional_headers = {}
+                rate_limiter.acquire(domain)
+                response = _timed_get(session, url, headers, stream, span)
+            
+            # Page disparue: inutile de réessayer
+            if response.status_code in (404, 410):
+                response.close()
+                circuit_breaker.record_success(domain)
+                domain_concurrency.record_success(domain)
+                negative_cache.record(url, 'not_found')
+                return _error_result(url, f"Page introuvable (HTTP {response.status_code})", status="not_found")
+            
+            # Site surchargé ou qui nous limite: réduire la concurrence du domaine pour tous les workers
+            if response.status_code in CONGESTION_STATUSES:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                domain_concurrency.record_congestion(domain, retry_after)
+            elif response.status_code < 400:
+                domain_concurrency.record_success(domain)
+            server_error = response.status_code >= 500 or response.status_code in CONGESTION_STATUSES
+            if server_error:
+                circuit_breaker.record_failure(domain, f"statut HTTP {response.status_code}")
+            
+            # Reconnaître les pages de blocage avant toute analyse ou mise en cache; le circuit
+            # compte une page de blocage comme un échec et une réponse saine une fois la page classée
+            if response.status_code >= 400 or not stream:
+                block_reason = detect_block_page(response.content, response.status_code)
+                if block_reason:
+                    if not server_error:
+                        circuit_breaker.record_failure(domain, block_reason)
+                    domain_backoff.record_block(domain, block_reason, delay=retry_after)
+                    return _error_result(url, f"Page de blocage détectée ({block_reason})", status="blocked")
+                if not server_error:
+                    circuit_breaker.record_success(domain)
+            
+            # Surcharge sans page de blocage: la limite du domaine a été réduite, réessayer
+            # après le délai demandé par le serveur
             response.raise_for_status()
             
-            # Sauvegarder la réponse dans le cache si activé
-            if use_cache and cache_file:
+            stream_info = None
+            if stream:
+                # Lecture en flux: l'extraction est faite dès que possible sur le début du document
+                download_start = time.perf_counter()
+                parse_before = span.timings.get('parse_ms', 0.0) if span is not None else 0.0
+                html_content, result, stream_info = _read_streaming(response, url, css_selector)
+                if span is not None:
+                    # La lecture en flux inclut l'analyse du début de page, déjà comptée dans parse_ms
+                    elapsed = (time.perf_counter() - download_start) * 1000
+                    span.add('download_ms', elapsed - (span.timings.get('parse_ms', 0.0) - parse_before))
+                    span.bytes += stream_info["bytes_read"]
+                if stream_info["truncated"]:
+                    saved = stream_info["bytes_saved"]
+                    logger.info(f"Lecture interrompue après {stream_info['bytes_read']} octets"
+                                + (f" ({saved} octets économisés)" if saved is not None else ""))
+            else:
+                html_content = response.text
+                result = None
+            
+            if stream and result is None:
+                # Page lue en entier: les pages de blocage sont courtes et passent par ici
+                block_reason = detect_block_page(html_content, response.status_code)
+                if block_reason:
+                    circuit_breaker.record_failure(domain, block_reason)
+                    domain_backoff.record_block(domain, block_reason)
+                    return _error_result(url, f"Page de blocage détectée ({block_reason})", status="blocked")
+            if stream:
+                circuit_breaker.record_success(domain)
+            
+            # Utiliser le parser e-commerce pour extraire les données
+            if result is None:
+                result = _parse(html_content, url, css_selector)
+            
+            # Sauvegarder la réponse et son extraction dans le cache si activé
+            if use_cache:
                 try:
-                    with open(cache_file, 'w', encoding='utf-8') as f:
-                        f.write(response.text)
-                    logger.debug(f"Réponse sauvegardée dans le cache: {cache_file}")
+                    partial = bool(stream_info and stream_info["truncated"])
+                    page_cache.put(url, html_content, response.headers, partial=partial)
+                    page_cache.put_extraction(url, css_selector, EcommerceParser.extraction_version(url), result)
+                    logger.debug(f"Réponse sauvegardée dans le cache: {url}")
                 except Exception as e:
                     logger.warning(f"Échec de sauvegarde dans le cache: {e}")
             
-            # Utiliser le parser e-commerce pour extraire les données
-            result = EcommerceParser.parse_page(response.text, url, css_selector)
-            
             if result["price_text"]:
+                domain_backoff.record_success(domain)
+                negative_cache.clear(url)
                 logger.info(f"Prix trouvé: {result['price_text']}")
-                
-                return {
-                    "price": result["price_text"],
-                    "title": result["title"],
-                    "currency": result["currency"],
-                    "status": "success",
-                    "numeric_price": result["numeric_price"],
-                    "availability": result["availability"],
-                    "image_url": result["image_url"],
-                    "url": url,
-                    "source": "live"
-                }
+                live_result = _build_result(result, url, "live")
+                if stream_info is not None:
+                    live_result["bytes_read"] = stream_info["bytes_read"]
+                    live_result["bytes_saved"] = stream_info["bytes_saved"]
+                return live_result
             else:
                 logger.warning(f"Élément de prix non trouvé avec le sélecteur: {css_selector}")
+                no_price = True
                 # Essayer des sélecteurs spécifiques au site comme solution de repli
                 if result["title"] != "Produit Inconnu":
                     logger.info(f"Titre du produit trouvé: {result['title']}, mais pas de prix avec le sélecteur fourni.")
         except requests.exceptions.HTTPError as e:
             logger.error(f"Erreur HTTP: {e}")
-            if e.response.status_code == 403:
-                logger.warning("Blocage possible détecté. Envisagez d'utiliser un proxy pour ce site.")
         except requests.exceptions.ConnectionError:
             logger.error(f"Erreur de connexion - tentative {attempt+1}/{retries}")
+            circuit_breaker.record_failure(domain, "erreur de connexion")
         except requests.exceptions.Timeout:
             logger.error(f"Erreur de délai d'attente - tentative {attempt+1}/{retries}")
+            circuit_breaker.record_failure(domain, "délai d'attente dépassé")
         except requests.exceptions.RequestException as e:
             logger.error(f"Exception de requête: {e}")
+            circuit_breaker.record_failure(domain, type(e).__name__)
         except Exception as e:
             logger.error(f"Erreur inattendue: {e}")
+        finally:
+            if slot_held:
+                domain_concurrency.release(domain)
     
-    return {
-        "price": None,
-        "title": "Produit Inconnu",
-        "currency": "Inconnu",
-        "status": "error",
-        "message": "Échec de récupération du prix après plusieurs tentatives",
-        "url": url,
-        "source": "error"
-    }
+    if no_price:
+        # Page obtenue mais sans prix: la revérifier plus tard plutôt qu'à chaque exécution
+        negative_cache.record(url, 'no_price')
+        return _error_result(url, "Aucun prix trouvé sur la page", status="no_price")
+    return _error_result(url, "Échec de récupération du prix après plusieurs tentatives")
+
+# Rafraîchissements en arrière-plan du mode 'swr' (stale-while-revalidate)
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='refresh')
+
+# Récupérations en cours dans ce processus, par (URL canonique, sélecteur)
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+def _single_flight(key, fetch):
+    """
+    Exécute fetch une seule fois pour des appels simultanés de même clé: le premier appelant
+    récupère la page, les suivants attendent son résultat et en reçoivent une copie.
+    """
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _in_flight[key] = future
+    if not leader:
+        logger.info(f"Récupération déjà en cours pour {key[0]}, attente du résultat")
+        return dict(future.result())
+    try:
+        result = fetch()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+
+def _log_refresh_error(future):
+    if future.exception() is not None:
+        logger.error(f"Échec du rafraîchissement en arrière-plan: {future.exception()}")
+
+def get_price(url, css_selector, retries=3, delay=2, use_cache=True, cache_duration=3600, stream=False, mode='fresh'):
+    """
+    Récupère le prix depuis un site web en utilisant le sélecteur CSS fourni.
+    Inclut la logique de réessai, des délais aléatoires et la mise en cache pour éviter d'être bloqué.
+    Chaque requête attend un créneau du limiteur de débit de son domaine (rate_limiter) et une
+    place libre dans sa limite de requêtes simultanées (domain_concurrency), réduite de moitié
+    sur 429/503/403. Un en-tête Retry-After remplace la pause fixe avant le réessai suivant.
+    Quand le disjoncteur du domaine est ouvert, le produit échoue immédiatement (statut "circuit_open").
+    L'URL est ramenée à sa forme canonique (scripts.urls) avant la récupération.
+    Les appels simultanés pour la même page partagent une seule récupération, dans le
+    processus (_single_flight) comme entre processus (verrou fichier du cache).
+    Une entrée de cache expirée est revalidée par requête conditionnelle (ETag / Last-Modified):
+    sur une réponse 304, l'extraction en cache est réutilisée sans téléchargement ni analyse.
+    
+    En mode 'swr' (stale-while-revalidate), une entrée expirée est renvoyée immédiatement
+    (source "stale", âge en secondes dans "cache_age") et la page est rafraîchie en arrière-plan.
+    Le mode 'fresh' (par défaut) attend toujours une page récupérée depuis moins de cache_duration.
+    Les durées de chaque étape sont enregistrées dans run_metrics (voir scripts.metrics).
+    
+    Args:
+        url (str): L'URL de la page du produit
+        css_selector (str): Sélecteur CSS pour l'élément de prix
+        retries (int): Nombre de tentatives de réessai
+        delay (int): Délai de base entre les réessais en secondes
+        use_cache (bool): Utiliser ou non les réponses mises en cache
+        cache_duration (int): Durée de validité du cache en secondes
+        stream (bool): Lire la page en flux et couper la connexion dès que les champs sont extraits
+        mode (str): 'fresh' pour une donnée à jour, 'swr' pour accepter une donnée expirée
+    
+    Returns:
+        dict: Informations sur le produit incluant le prix, le titre, etc.
+    """
+    # Sans paramètres de suivi: même page, même entrée de cache
+    url = canonical_url(url)
+    with run_metrics.span(url) as span:
+        result = _get_price(url, css_selector, retries, delay, use_cache, cache_duration, stream, mode)
+        span.finish(result)
+    return result
+
+def _get_price(url, css_selector, retries, delay, use_cache, cache_duration, stream, mode):
+    """Corps de get_price pour une URL déjà canonique."""
+    if use_cache:
+        cached = _cached_result(url, css_selector, cache_duration)
+        if cached is not None:
+            return cached
+    
+    def fetch():
+        if not use_cache:
+            return _fetch_live(url, css_selector, retries, delay, use_cache, stream)
+        # Un seul processus télécharge la page; les autres attendent puis relisent le cache
+        with page_cache.fetch_lock(url) as lock:
+            if lock.waited:
+                page_cache.refresh()
+                cached = _cached_result(url, css_selector, cache_duration)
+                if cached is not None:
+                    logger.info(f"Page récupérée par un autre processus, cache réutilisé pour {url}")
+                    return cached
+            return _fetch_live(url, css_selector, retries, delay, use_cache, stream)
+    
+    if use_cache and mode == 'swr':
+        entry = page_cache.lookup(url)
+        stale = _cached_result(url, css_selector, None) if entry is not None else None
+        if stale is not None and stale["status"] == "success":
+            logger.info(f"Données expirées renvoyées pour {url} (âge {entry['age']:.0f} s), rafraîchissement en arrière-plan")
+            _refresh_executor.submit(_single_flight, (url, css_selector), fetch).add_done_callback(_log_refresh_error)
+            stale["source"] = "stale"
+            stale["cache_age"] = entry["age"]
+            return stale
+    
+    return _single_flight((url, css_selector), fetch)
+
+def get_prices_bulk(products, max_concurrency=DEFAULT_MAX_CONCURRENCY, parse_workers=None, **kwargs):
+    """
+    Récupère les prix de plusieurs produits en parallèle.
+    Les attentes réseau (délais d'attente, pauses entre réessais) se chevauchent
+    grâce à un pool de threads borné, et les résultats conservent l'ordre d'entrée.
+    
+    Les produits sont répartis par domaine et distribués à tour de rôle: un produit n'est
+    confié à un worker que lorsque son domaine a un créneau libre (rate_limiter), moins de
+    requêtes en cours que sa limite adaptative (domain_concurrency) et n'est pas en pause
+    après un Retry-After ou une page de blocage (domain_backoff). Les domaines différents
+    avancent ainsi en parallèle sans qu'un domaine lent n'occupe tous les workers en attente.
+    Les produits qui désignent la même page (même URL canonique et même sélecteur) ne sont
+    récupérés qu'une fois; chacun reçoit sa propre copie du résultat.
+    
+    L'analyse HTML, qui occupe le processeur, est confiée à un pool de processus (ParsePool)
+    pendant le lot: les threads continuent de télécharger pendant que les pages reçues sont
+    analysées sur les autres cœurs.
+    
+    Args:
+        products (list): Produits à traiter, chacun avec une clé 'url' et éventuellement 'css_selector'
+        max_concurrency (int): Nombre maximum de récupérations simultanées
+        parse_workers (int): Processus d'analyse (DEFAULT_PARSE_WORKERS par défaut, 1 pour analyser dans les threads)
+        **kwargs: Options transmises à get_price (retries, delay, use_cache, cache_duration, stream)
+    
+    Returns:
+        list: Un résultat de get_price par produit, dans le même ordre que products
+    """
+    products = list(products)
+    if not products:
+        return []
+    
+    def fetch(product):
+        url = product['url']
+        try:
+            return get_price(url, product.get('css_selector'), **kwargs)
+        except Exception as e:
+            # get_price gère déjà ses erreurs, mais un produit ne doit jamais interrompre le lot
+            logger.error(f"Erreur inattendue lors de la récupération de {url}: {e}")
+            return _error_result(url, str(e))
+    
+    # Une seule récupération par page: les produits en double partagent la même tâche
+    targets = []
+    target_of = {}
+    fan_out = []
+    for product in products:
+        key = (canonical_url(product['url']), product.get('css_selector'))
+        if key not in target_of:
+            target_of[key] = len(targets)
+            targets.append(product)
+        fan_out.append(target_of[key])
+    if len(targets) < len(products):
+        logger.info(f"{len(products) - len(targets)} produits en double regroupés avec une autre fiche")
+    
+    # File d'attente par domaine, dans l'ordre d'entrée des produits
+    queues = {}
+    for index, product in enumerate(targets):
+        queues.setdefault(urlparse(product['url']).netloc.lower(), deque()).append(index)
+    
+    workers = max(1, min(max_concurrency, len(targets)))
+    # Garde assez de connexions ouvertes par domaine pour tous les workers
+    session_manager.pool_maxsize = max(session_manager.pool_maxsize, workers)
+    logger.info(f"Récupération de {len(targets)} pages sur {len(queues)} domaines "
+                f"avec {workers} requêtes simultanées")
+    
+    global _parse_pool
+    parse_workers = min(parse_workers or DEFAULT_PARSE_WORKERS, workers)
+    pool = ParsePool(parse_workers, PARSER_BACKEND) if parse_workers > 1 and _parse_pool is None else None
+    if pool is not None:
+        _parse_pool = pool
+        logger.info(f"Analyse HTML dans {parse_workers} processus")
+    try:
+        results = _run_bulk(targets, queues, workers, fetch)
+    finally:
+        if pool is not None:
+            _parse_pool = None
+            pool.close()
+        page_cache.flush()
+        selector_stats.flush()
+        template_cache.flush()
+    return [dict(results[index]) for index in fan_out]
+
+def _run_bulk(targets, queues, workers, fetch):
+    """Distribue les récupérations par domaine (voir get_prices_bulk) et retourne les résultats."""
+    results = [None] * len(targets)
+    in_flight = {}
+    active = dict.fromkeys(queues, 0)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scraper') as executor:
+        while queues or in_flight:
+            next_slot = None
+            # Tour de rôle sur les domaines ayant un créneau libre
+            for domain in list(queues):
+                if len(in_flight) >= workers:
+                    break
+                if active[domain] >= domain_concurrency.limit(domain):
+                    continue
+                # Domaine en pause (Retry-After ou page de blocage): sa file attend la reprise
+                wait_time = max(rate_limiter.ready_in(domain), domain_concurrency.pause_remaining(domain),
+                                domain_backoff.remaining(domain))
+                if wait_time > 0:
+                    next_slot = wait_time if next_slot is None else min(next_slot, wait_time)
+                    continue
+                index = queues[domain].popleft()
+                if not queues[domain]:
+                    del queues[domain]
+                in_flight[executor.submit(fetch, targets[index])] = (index, domain)
+                active[domain] += 1
+            
+            if not in_flight:
+                # Aucun domaine prêt: attendre le prochain créneau
+                time.sleep(next_slot or 0.05)
+                continue
+            done, _ = wait(in_flight, timeout=next_slot, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, domain = in_flight.pop(future)
+                active[domain] -= 1
+                results[index] = future.result()
+    return results
 
 if __name__ == "__main__":
     import argparse
@@ -161,6 +789,7 @@ if __name__ == "__main__":
     parser.add_argument('--no-cache', action='store_true', help='Disable response caching')
     parser.add_argument('--retries', '-r', type=int, default=3, help='Number of retry attempts')
     parser.add_argument('--detect', '-d', action='store_true', help='Detect site and suggest selectors')
+    parser.add_argument('--stream', action='store_true', help='Stop downloading once every field has been extracted')
     
     args = parser.parse_args()
     
@@ -179,7 +808,8 @@ if __name__ == "__main__":
         args.url, 
         args.selector, 
         retries=args.retries, 
-        use_cache=not args.no_cache
+        use_cache=not args.no_cache,
+        stream=args.stream
     )
     
     # Print nicely formatted result
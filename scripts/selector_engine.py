@@ -0,0 +1,593 @@
+"""
+Extraction multi-champs en un seul parcours du document.
+
+Au lieu d'appeler select_one pour chaque sélecteur de chaque champ (jusqu'à ~17 parcours
+de l'arbre par page), FieldExtractor reçoit toutes les listes de sélecteurs à la fois et
+parcourt le document une seule fois dans l'ordre. Chaque élément n'est testé que contre
+les sélecteurs dont la partie droite peut lui correspondre (même id, même classe ou même
+balise), et le parcours s'arrête dès que chaque champ est résolu. L'ordre de priorité
+des sélecteurs d'un champ est conservé: le résultat est identique à des select_one successifs.
+
+Seul un sous-ensemble courant de CSS est compilé (balise, #id, .classe, [attr], [attr=valeur],
+combinateurs descendant et enfant). Les autres sélecteurs sont évalués par le backend.
+"""
+import bisect
+import re
+
+from bs4 import Tag
+
+from scripts.html_backends import LxmlDocument, LxmlElement
+
+_COMPOUND_RE = re.compile(
+    r"""([a-zA-Z][\w-]*|\*)?((?:\#[\w-]+|\.[\w-]+|\[\s*[\w-]+\s*(?:=\s*(?:"[^"]*"|'[^']*'|[\w-]+)\s*)?\])*)$"""
+)
+_PART_RE = re.compile(r"""\#([\w-]+)|\.([\w-]+)|\[\s*([\w-]+)\s*(?:=\s*(?:"([^"]*)"|'([^']*)'|([\w-]+))\s*)?\]""")
+
+_compiled = {}
+
+# Contexte qui précède une valeur d'identifiant ou de classe dans une balise ouvrante
+_ATTRIBUTE_CONTEXT = {
+    'id': re.compile(r'(?i:\bid)\s*=\s*["\']?\Z'),
+    'class': re.compile(r'(?i:\bclass)\s*=\s*(?:"(?:[^"]*\s)?|\'(?:[^\']*\s)?)?\Z'),
+}
+
+
+class Compound:
+    """Partie simple d'un sélecteur: balise, id, classes et attributs."""
+
+    __slots__ = ('tag', 'id', 'classes', 'attrs')
+
+    def __init__(self, tag, element_id, classes, attrs):
+        self.tag = tag
+        self.id = element_id
+        self.classes = classes
+        self.attrs = attrs
+
+
+class CompiledSelector:
+    """Sélecteur découpé de droite à gauche en parties simples reliées par des combinateurs."""
+
+    __slots__ = ('selector', 'parts', 'key')
+
+    def __init__(self, selector, parts):
+        self.selector = selector
+        # parts[0] est la partie la plus à droite; chaque partie suivante est liée par son combinateur
+        self.parts = parts
+        rightmost = parts[0][1]
+        if rightmost.id is not None:
+            self.key = ('id', rightmost.id)
+        elif rightmost.classes:
+            self.key = ('class', rightmost.classes[0])
+        elif rightmost.tag is not None:
+            self.key = ('tag', rightmost.tag)
+        else:
+            self.key = ('any', None)
+
+
+def _parse_compound(text):
+    match = _COMPOUND_RE.match(text)
+    if not match or not text:
+        return None
+    tag = match.group(1)
+    element_id = None
+    classes = []
+    attrs = []
+    for part in _PART_RE.finditer(match.group(2)):
+        if part.group(1) is not None:
+            if element_id is not None and element_id != part.group(1):
+                return None
+            element_id = part.group(1)
+        elif part.group(2) is not None:
+            classes.append(part.group(2))
+        else:
+            value = next((v for v in part.group(4, 5, 6) if v is not None), None)
+            attrs.append((part.group(3).lower(), value))
+    return Compound(None if tag in (None, '*') else tag.lower(), element_id, tuple(classes), tuple(attrs))
+
+
+def compile_selector(selector):
+    """
+    Compile un sélecteur CSS pour le moteur en un seul parcours.
+
+    Returns:
+        CompiledSelector, ou None si le sélecteur utilise une syntaxe non prise en charge
+    """
+    if selector in _compiled:
+        return _compiled[selector]
+    compounds = []
+    combinators = []
+    expect_compound = True
+    valid = True
+    for token in selector.replace('>', ' > ').split():
+        if token == '>':
+            if expect_compound:
+                valid = False
+                break
+            combinators.append('>')
+            expect_compound = True
+            continue
+        if not expect_compound:
+            combinators.append(' ')
+        compound = _parse_compound(token)
+        if compound is None:
+            valid = False
+            break
+        compounds.append(compound)
+        expect_compound = False
+
+    compiled = None
+    if valid and compounds and not expect_compound:
+        # De droite à gauche: chaque partie porte le combinateur qui la relie à sa voisine de gauche
+        parts = [
+            (combinators[index - 1] if index > 0 else None, compounds[index])
+            for index in range(len(compounds) - 1, -1, -1)
+        ]
+        compiled = CompiledSelector(selector, parts)
+    _compiled[selector] = compiled
+    return compiled
+
+
+class _Bs4Access:
+    """Accès aux éléments d'un arbre BeautifulSoup."""
+
+    @staticmethod
+    def iter_elements(document):
+        for node in document.descendants:
+            if isinstance(node, Tag):
+                yield node
+
+    @staticmethod
+    def tag(element):
+        return element.name
+
+    @staticmethod
+    def element_id(element):
+        value = element.attrs.get('id')
+        if isinstance(value, list):
+            value = ' '.join(value)
+        return value
+
+    @staticmethod
+    def classes(element):
+        value = element.attrs.get('class')
+        if value is None:
+            return ()
+        return value if isinstance(value, list) else value.split()
+
+    @staticmethod
+    def attr(element, name):
+        value = element.attrs.get(name)
+        if isinstance(value, list):
+            value = ' '.join(value)
+        return value
+
+    @staticmethod
+    def parent(element):
+        parent = element.parent
+        # L'objet BeautifulSoup lui-même n'est jamais un élément sélectionnable
+        if parent is None or parent.parent is None:
+            return None
+        return parent
+
+    @staticmethod
+    def wrap(element):
+        return element
+
+    @staticmethod
+    def unwrap(element):
+        return element
+
+    @staticmethod
+    def top_elements(document):
+        return [node for node in document.children if isinstance(node, Tag)]
+
+    @staticmethod
+    def child_elements(element):
+        return [node for node in element.children if isinstance(node, Tag)]
+
+    @staticmethod
+    def source_position(element):
+        # (ligne, colonne) de la balise ouvrante, enregistrées par html.parser
+        if element.sourceline is None:
+            return None
+        return element.sourceline, element.sourcepos
+
+
+class _LxmlAccess:
+    """Accès aux éléments d'un arbre lxml."""
+
+    @staticmethod
+    def iter_elements(document):
+        if document.root is None:
+            return
+        for element in document.root.iter():
+            if isinstance(element.tag, str):
+                yield element
+
+    @staticmethod
+    def tag(element):
+        return element.tag
+
+    @staticmethod
+    def element_id(element):
+        return element.get('id')
+
+    @staticmethod
+    def classes(element):
+        value = element.get('class')
+        return value.split() if value else ()
+
+    @staticmethod
+    def attr(element, name):
+        return element.get(name)
+
+    @staticmethod
+    def parent(element):
+        return element.getparent()
+
+    @staticmethod
+    def wrap(element):
+        return LxmlElement(element)
+
+    @staticmethod
+    def unwrap(element):
+        return element.element
+
+    @staticmethod
+    def top_elements(document):
+        return [document.root] if document.root is not None else []
+
+    @staticmethod
+    def child_elements(element):
+        return [child for child in element if isinstance(child.tag, str)]
+
+    @staticmethod
+    def source_position(element):
+        # lxml ne donne que la ligne: insuffisant pour comparer deux éléments d'une même ligne
+        return None
+
+
+def _matches_compound(access, element, compound):
+    if compound.tag is not None and access.tag(element) != compound.tag:
+        return False
+    if compound.id is not None and access.element_id(element) != compound.id:
+        return False
+    if compound.classes:
+        element_classes = access.classes(element)
+        for name in compound.classes:
+            if name not in element_classes:
+                return False
+    for name, value in compound.attrs:
+        actual = access.attr(element, name)
+        if actual is None or (value is not None and actual != value):
+            return False
+    return True
+
+
+def _element_path(access, document, element):
+    """Chemin d'un élément depuis la racine: indices parmi les éléments enfants de chaque ancêtre."""
+    path = []
+    while element is not None:
+        parent = access.parent(element)
+        siblings = access.child_elements(parent) if parent is not None else access.top_elements(document)
+        index = next((i for i, sibling in enumerate(siblings) if sibling is element), None)
+        if index is None:
+            return None
+        path.append(index)
+        element = parent
+    return path[::-1]
+
+
+def _follow_path(access, document, path):
+    """Élément désigné par un chemin de _element_path, ou None si la structure diffère."""
+    siblings = access.top_elements(document)
+    element = None
+    for index in path:
+        if index >= len(siblings):
+            return None
+        element = siblings[index]
+        siblings = access.child_elements(element)
+    return element
+
+
+def _key_offsets(html_content, key):
+    """
+    Positions, dans l'ordre du HTML brut, où un élément peut porter la clé d'un sélecteur compilé
+    (id, classe ou balise de sa partie la plus à droite). Condition nécessaire seulement: tout
+    élément qui correspond au sélecteur a sa clé à l'une de ces positions, mais une position peut
+    aussi venir d'un script ou d'un attribut voisin. Les clés 'any' ne sont pas prises en charge.
+    """
+    kind, value = key
+    if kind == 'tag':
+        for match in re.finditer('<' + re.escape(value) + r'(?![\w:-])', html_content, re.IGNORECASE):
+            yield match.start()
+        return
+    context = _ATTRIBUTE_CONTEXT[kind]
+    window = 64 if kind == 'id' else 4096
+    start = html_content.find(value)
+    while start != -1:
+        following = html_content[start + len(value):start + len(value) + 1]
+        if not (following.isalnum() or following in ('-', '_')):
+            if context.search(html_content, max(0, start - window), start):
+                yield start
+        start = html_content.find(value, start + 1)
+
+
+def _absent_from_source(selectors, html_content):
+    """
+    Vrai si aucun des sélecteurs ne peut correspondre à un élément de la page: chacun est
+    compilé et sa clé n'apparaît nulle part dans le HTML brut (voir _key_offsets).
+    """
+    for selector in selectors:
+        compiled = compile_selector(selector)
+        if (compiled is None or compiled.key[0] == 'any'
+                or next(_key_offsets(html_content, compiled.key), None) is not None):
+            return False
+    return True
+
+
+class _LineIndex:
+    """
+    (ligne, colonne) de positions du HTML brut, comptées comme html.parser; les lignes sont
+    comptées depuis la position déjà calculée la plus proche pour ne parcourir le texte qu'une fois.
+    """
+
+    def __init__(self, html_content):
+        self.html_content = html_content
+        self.offsets = [0]
+        self.lines = [1]
+
+    def line_column(self, offset):
+        index = bisect.bisect_right(self.offsets, offset) - 1
+        line = self.lines[index] + self.html_content.count('\n', self.offsets[index], offset)
+        self.offsets.insert(index + 1, offset)
+        self.lines.insert(index + 1, line)
+        return line, offset - (self.html_content.rfind('\n', 0, offset) + 1)
+
+
+def _matches(access, element, parts, index=0):
+    """Teste element contre parts[index:] (de droite à gauche), avec retour arrière sur les ancêtres."""
+    link, compound = parts[index]
+    if not _matches_compound(access, element, compound):
+        return False
+    if link is None:
+        return True
+    parent = access.parent(element)
+    if link == '>':
+        return parent is not None and _matches(access, parent, parts, index + 1)
+    while parent is not None:
+        if _matches(access, parent, parts, index + 1):
+            return True
+        parent = access.parent(parent)
+    return False
+
+
+class FieldExtractor:
+    """
+    Résout plusieurs champs, chacun décrit par une liste ordonnée de sélecteurs,
+    en un seul parcours du document.
+
+    Pour chaque champ, le résultat est l'élément trouvé par le premier sélecteur de la liste
+    qui correspond à un élément du document (premier élément dans l'ordre du document),
+    exactement comme des appels successifs à select_one. Un attribut requis peut être donné:
+    un sélecteur dont la première correspondance n'a pas cet attribut est alors ignoré.
+    """
+
+    def __init__(self, fields):
+        """
+        Args:
+            fields (list): Tuples (nom du champ, liste de sélecteurs, attribut requis ou None)
+        """
+        self.fields = [(name, list(selectors), required_attr) for name, selectors, required_attr in fields]
+        # Extracteurs raccourcis par leading, par listes de sélecteurs
+        self._led = {}
+        self.selectors = []
+        self.fallback = []
+        self.by_id = {}
+        self.by_class = {}
+        self.by_tag = {}
+        self.universal = []
+        seen = set()
+        for _, selectors, _ in self.fields:
+            for selector in selectors:
+                if selector in seen:
+                    continue
+                seen.add(selector)
+                compiled = compile_selector(selector)
+                if compiled is None:
+                    self.fallback.append(selector)
+                    continue
+                self.selectors.append(compiled)
+                kind, value = compiled.key
+                if kind == 'id':
+                    self.by_id.setdefault(value, []).append(compiled)
+                elif kind == 'class':
+                    self.by_class.setdefault(value, []).append(compiled)
+                elif kind == 'tag':
+                    self.by_tag.setdefault(value, []).append(compiled)
+                else:
+                    self.universal.append(compiled)
+
+    def _resolve(self, first_matches, access, finished):
+        """
+        Calcule le résultat de chaque champ à partir des premières correspondances connues.
+        Retourne (résultats, tous résolus), un champ restant indéterminé tant qu'un sélecteur
+        plus prioritaire que la meilleure correspondance peut encore correspondre.
+        """
+        results = {}
+        all_resolved = True
+        for name, selectors, required_attr in self.fields:
+            results[name] = None
+            for selector in selectors:
+                if selector not in first_matches:
+                    if not finished:
+                        all_resolved = False
+                        break
+                    continue
+                element = first_matches[selector]
+                if element is None:
+                    continue
+                if required_attr is not None and access.attr(element, required_attr) is None:
+                    continue
+                results[name] = (selector, access.wrap(element))
+                break
+        return results, all_resolved
+
+    def extract(self, document):
+        """
+        Parcourt le document une fois et retourne, pour chaque champ, le couple
+        (sélecteur retenu, élément) ou None.
+        """
+        access = _LxmlAccess if isinstance(document, LxmlDocument) else _Bs4Access
+
+        first_matches = {}
+        # Sélecteurs non compilables: évalués directement par le backend
+        for selector in self.fallback:
+            element = document.select_one(selector)
+            if isinstance(element, LxmlElement):
+                element = element.element
+            if element is not None:
+                first_matches[selector] = element
+        _, resolved = self._resolve(first_matches, access, finished=False)
+
+        if not resolved:
+            pending = len(self.selectors)
+            for element in access.iter_elements(document):
+                candidates = list(self.universal)
+                element_id = access.element_id(element)
+                if element_id is not None and element_id in self.by_id:
+                    candidates.extend(self.by_id[element_id])
+                for name in access.classes(element):
+                    if name in self.by_class:
+                        candidates.extend(self.by_class[name])
+                tag_candidates = self.by_tag.get(access.tag(element))
+                if tag_candidates:
+                    candidates.extend(tag_candidates)
+
+                matched = False
+                for compiled in candidates:
+                    if compiled.selector in first_matches:
+                        continue
+                    if _matches(access, element, compiled.parts):
+                        first_matches[compiled.selector] = element
+                        pending -= 1
+                        matched = True
+                if matched:
+                    _, resolved = self._resolve(first_matches, access, finished=False)
+                    if resolved or pending == 0:
+                        break
+
+        results, _ = self._resolve(first_matches, access, finished=True)
+        return results
+
+    def leading(self, leaders, html_content):
+        """
+        Extracteur dont chaque champ commence à son sélecteur gagnant récemment (leaders), quand
+        aucun sélecteur plus prioritaire du champ ne peut correspondre d'après le HTML brut
+        (voir _absent_from_source, la même garde que _at_path). extract donne alors le même
+        résultat qu'avec la liste complète, mais peut s'arrêter dès que le gagnant a trouvé son
+        élément au lieu de parcourir la page pour écarter les sélecteurs précédents.
+
+        Args:
+            leaders (dict): Sélecteur gagnant récemment pour chaque champ
+            html_content (str): HTML brut de la page
+
+        Returns:
+            FieldExtractor: Extracteur raccourci, ou self si aucun champ ne peut l'être
+        """
+        fields = []
+        shortened = False
+        for name, selectors, required_attr in self.fields:
+            leader = leaders.get(name)
+            if leader in selectors[1:]:
+                position = selectors.index(leader)
+                if _absent_from_source(selectors[:position], html_content):
+                    selectors = selectors[position:]
+                    shortened = True
+            fields.append((name, selectors, required_attr))
+        if not shortened:
+            return self
+        key = tuple(tuple(selectors) for _, selectors, _ in fields)
+        extractor = self._led.get(key)
+        if extractor is None:
+            extractor = FieldExtractor(fields)
+            self._led[key] = extractor
+        return extractor
+
+    def node_paths(self, document, results):
+        """
+        Décrit le résultat d'extract pour un gabarit de page: pour chaque champ,
+        [sélecteur retenu, chemin du nœud] ou None si le champ est absent.
+        """
+        access = _LxmlAccess if isinstance(document, LxmlDocument) else _Bs4Access
+        paths = {}
+        for name, _, _ in self.fields:
+            match = results.get(name)
+            if match is None:
+                paths[name] = None
+                continue
+            path = _element_path(access, document, access.unwrap(match[1]))
+            paths[name] = [match[0], path] if path is not None else None
+        return paths
+
+    def locate(self, document, paths, html_content):
+        """
+        Retrouve les champs aux chemins d'un gabarit connu (voir node_paths), sans parcourir
+        le document, quand le nœud est sûrement celui qu'extract retiendrait (voir _at_path).
+        Les autres champs, dont ceux absents du gabarit, sont cherchés par un parcours limité
+        à ces seuls champs.
+
+        Returns:
+            tuple: (résultats au format d'extract, noms des champs cherchés par parcours),
+                   ou None si le gabarit ne décrit pas tous les champs
+        """
+        access = _LxmlAccess if isinstance(document, LxmlDocument) else _Bs4Access
+        line_index = _LineIndex(html_content)
+        results = {}
+        search = []
+        for name, selectors, required_attr in self.fields:
+            if name not in paths:
+                return None
+            located = self._at_path(access, document, line_index, paths[name], selectors, required_attr)
+            if located is None:
+                search.append((name, selectors, required_attr))
+            else:
+                results[name] = located
+        if search:
+            results.update(FieldExtractor(search).extract(document))
+        return results, [name for name, _, _ in search]
+
+    @staticmethod
+    def _at_path(access, document, line_index, stored, selectors, required_attr):
+        """
+        Résultat d'un champ pris au chemin d'un gabarit, ou None s'il n'est pas sûr qu'extract
+        donnerait le même: le nœud doit correspondre à son sélecteur et porter l'attribut requis,
+        aucun sélecteur plus prioritaire du champ ne doit apparaître dans le HTML brut, et aucun
+        élément précédant le nœud ne doit porter la clé de son sélecteur. Un champ absent du
+        gabarit n'est jamais supposé absent de la page.
+        """
+        if stored is None:
+            return None
+        html_content = line_index.html_content
+        selector, path = stored
+        compiled = compile_selector(selector) if selector in selectors else None
+        if compiled is None or compiled.key[0] == 'any':
+            return None
+        if not _absent_from_source(selectors[:selectors.index(selector)], html_content):
+            return None
+        element = _follow_path(access, document, path)
+        if element is None or not _matches(access, element, compiled.parts):
+            return None
+        if required_attr is not None and access.attr(element, required_attr) is None:
+            return None
+        # Premier élément du document à correspondre: aucune clé avant sa balise ouvrante,
+        # ou, sans position dans la source, une seule clé dans toute la page
+        offsets = _key_offsets(html_content, compiled.key)
+        first = next(offsets, None)
+        position = access.source_position(element)
+        if position is not None:
+            if first is not None and line_index.line_column(first) < position:
+                return None
+        elif next(offsets, None) is not None:
+            return None
+        return selector, access.wrap(element)
@@ -0,0 +1,177 @@
+"""
+Statistiques de réussite des sélecteurs CSS, par site et par champ.
+Chaque page analysée par le DOM enregistre le sélecteur qui a fourni chaque champ (ou un
+échec). Ces compteurs servent à deux choses:
+  - l'essai en premier du sélecteur gagnant récemment (leaders), qui permet à FieldExtractor
+    d'arrêter son parcours tôt après une refonte de site au lieu de parcourir toute la page
+    pour écarter des sélecteurs devenus morts. Il n'est essayé en premier que si le HTML brut
+    montre qu'aucun sélecteur plus prioritaire ne peut correspondre (FieldExtractor.leading):
+    la valeur reste celle du premier sélecteur de data/sites.json qui correspond;
+  - la détection de dérive: le taux de réussite récent d'un champ baisse avant que les
+    prix ne disparaissent des rapports.
+Les scores récents décroissent exponentiellement à chaque page pour suivre les refontes.
+Les compteurs sont fusionnés avec le fichier sur disque sous verrou, pour être partagés
+entre processus.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from scripts.cache import CACHE_DIR, FileLock, PageCache
+
+logger = logging.getLogger('selector_stats')
+
+# Poids conservé par les observations précédentes à chaque nouvelle page (demi-vie ~23 pages)
+DECAY = 0.97
+
+# Taux de réussite récent en dessous duquel un champ est signalé comme en dérive
+DRIFT_THRESHOLD = 0.8
+
+# Nombre de pages (pondérées) avant de signaler une dérive
+DRIFT_MIN_PAGES = 5
+
+
+def _empty_field():
+    return {'pages': 0, 'misses': 0, 'hits': {}, 'recent_pages': 0.0, 'scores': {}}
+
+
+class SelectorStats:
+    """Compteurs de réussite des sélecteurs {site: {champ: statistiques}}, persistés en JSON."""
+
+    FILE_NAME = 'selector_stats.json'
+
+    def __init__(self, cache_dir=CACHE_DIR, flush_interval=60):
+        """
+        Args:
+            cache_dir (str): Répertoire du cache
+            flush_interval (float): Délai maximal entre deux enregistrements sur disque, en secondes
+        """
+        self.path = os.path.join(cache_dir, self.FILE_NAME)
+        self.lock_path = os.path.join(cache_dir, PageCache.LOCKS_NAME, 'selector_stats.lock')
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        self._stats = self._read()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stats = json.load(f)
+            return stats if isinstance(stats, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Statistiques de sélecteurs illisibles, elles seront reconstruites: {e}")
+            return {}
+
+    @staticmethod
+    def _observe(stats, selector):
+        stats['pages'] += 1
+        stats['recent_pages'] = stats['recent_pages'] * DECAY + 1
+        stats['scores'] = {name: score * DECAY for name, score in stats['scores'].items()}
+        if selector is None:
+            stats['misses'] += 1
+        else:
+            stats['hits'][selector] = stats['hits'].get(selector, 0) + 1
+            stats['scores'][selector] = stats['scores'].get(selector, 0.0) + 1
+
+    def record(self, site, matches):
+        """
+        Enregistre le résultat de l'analyse d'une page.
+
+        Args:
+            site (str): Nom du site
+            matches (dict): Sélecteur retenu pour chaque champ, ou None si aucun n'a trouvé d'élément
+        """
+        with self._lock:
+            for field, selector in matches.items():
+                self._observe(self._stats.setdefault(site, {}).setdefault(field, _empty_field()), selector)
+                self._observe(self._pending.setdefault(site, {}).setdefault(field, _empty_field()), selector)
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def leaders(self, site):
+        """Retourne le sélecteur gagnant récemment pour chaque champ d'un site ({champ: sélecteur})."""
+        with self._lock:
+            return {
+                field: max(stats['scores'], key=stats['scores'].get)
+                for field, stats in self._stats.get(site, {}).items() if stats['scores']
+            }
+
+    @staticmethod
+    def _merge(stats, pending):
+        """Ajoute des observations en attente à des statistiques (sur disque ou en mémoire)."""
+        for site, fields in pending.items():
+            for field, delta in fields.items():
+                merged = stats.setdefault(site, {}).setdefault(field, _empty_field())
+                # Les scores existants vieillissent du nombre de pages observées entre-temps
+                aging = DECAY ** delta['pages']
+                merged['pages'] += delta['pages']
+                merged['misses'] += delta['misses']
+                for selector, hits in delta['hits'].items():
+                    merged['hits'][selector] = merged['hits'].get(selector, 0) + hits
+                merged['recent_pages'] = merged['recent_pages'] * aging + delta['recent_pages']
+                scores = {name: score * aging for name, score in merged['scores'].items()}
+                for selector, score in delta['scores'].items():
+                    scores[selector] = scores.get(selector, 0.0) + score
+                merged['scores'] = scores
+        return stats
+
+    def flush(self):
+        """Ajoute les observations de ce processus au fichier sur disque, sous verrou."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            with FileLock(self.lock_path, timeout=10, stale_after=30):
+                stats = self._merge(self._read(), pending)
+                tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(stats, f, indent=1, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Impossible d'enregistrer les statistiques de sélecteurs: {e}")
+            with self._lock:
+                self._pending = self._merge(pending, self._pending)
+            return
+        with self._lock:
+            # Reprend les observations des autres processus, plus celles arrivées pendant l'écriture
+            self._stats = self._merge(stats, json.loads(json.dumps(self._pending)))
+
+    def report(self):
+        """
+        Taux de réussite par site et par champ.
+
+        Returns:
+            dict: {site: {champ: pages, hit_rate (cumulé), recent_hit_rate, leader (sélecteur
+                  gagnant récemment), hits par sélecteur, drift (taux récent sous DRIFT_THRESHOLD)}}
+        """
+        with self._lock:
+            snapshot = json.loads(json.dumps(self._stats))
+        report = {}
+        for site, fields in snapshot.items():
+            for field, stats in fields.items():
+                recent_hits = sum(stats['scores'].values())
+                recent_rate = recent_hits / stats['recent_pages'] if stats['recent_pages'] else None
+                leader = max(stats['scores'], key=stats['scores'].get) if stats['scores'] else None
+                report.setdefault(site, {})[field] = {
+                    'pages': stats['pages'],
+                    'hit_rate': round(1 - stats['misses'] / stats['pages'], 3) if stats['pages'] else None,
+                    'recent_hit_rate': round(recent_rate, 3) if recent_rate is not None else None,
+                    'leader': leader,
+                    'hits': dict(sorted(stats['hits'].items(), key=lambda item: -item[1])),
+                    'drift': (recent_rate is not None and stats['recent_pages'] >= DRIFT_MIN_PAGES
+                              and recent_rate < DRIFT_THRESHOLD),
+                }
+        return report
+
+
+# Statistiques partagées par l'analyseur et le scraper
+selector_stats = SelectorStats()
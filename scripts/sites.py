@@ -0,0 +1,146 @@
+"""
+Registre des sites e-commerce pris en charge.
+Chaque site est décrit une fois dans data/sites.json: suffixes de domaine, sélecteurs CSS
+par champ, conteneurs à analyser, lecture des données structurées, motifs de lecture
+directe du HTML (scan), règles de normalisation des prix, règle d'URL canonique et
+politique de récupération. Un nouveau marchand s'ajoute dans ce fichier sans modifier le code.
+
+La recherche d'un site se fait sur l'hôte seul (jamais sur le chemin ni les paramètres):
+les suffixes de l'hôte sont cherchés dans une table de hachage ('www.fnac.com' puis
+'fnac.com'...), puis chacun de ses labels ('amazon' pour 'www.amazon.co.jp').
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from urllib.parse import urlsplit
+
+logger = logging.getLogger('sites')
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SITES_FILE = os.environ.get('PRICE_TRACKER_SITES_FILE', os.path.join(BASE_DIR, 'data', 'sites.json'))
+
+GENERIC = 'generic'
+
+# Champs extraits de chaque page produit
+FIELDS = ('price', 'title', 'availability', 'image')
+
+DEFAULT_CURRENCY_SYMBOLS = ('€', '$', '£', '¥')
+
+
+class SiteProfile:
+    """Description d'un site: domaines, sélecteurs, normalisation des prix et politique de récupération."""
+
+    def __init__(self, name, config):
+        self.name = name
+        # Empreinte de la configuration: change dès que le profil est modifié dans data/sites.json
+        self.digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        self.domains = tuple(domain.lower() for domain in config.get('domains', ()))
+        self.labels = tuple(label.lower() for label in config.get('labels', ()))
+        self.canonical = config.get('canonical')
+        self.structured_data = bool(config.get('structured_data', True))
+        selectors = config.get('selectors', {})
+        self.selectors = {field: list(selectors.get(field, ())) for field in FIELDS}
+        # Conteneurs (#id) qui englobent tous les champs: le reste de la page n'est pas construit
+        scope = config.get('parse_scope', ())
+        if any(not selector.startswith('#') for selector in scope):
+            raise ValueError(f"parse_scope n'accepte que des sélecteurs d'identifiant (#id): {scope}")
+        self.parse_scope = frozenset(selector[1:] for selector in scope)
+        price = config.get('price', {})
+        self.currency_symbols = tuple(price.get('currency_symbols', DEFAULT_CURRENCY_SYMBOLS))
+        self.thousands_separators = tuple(price.get('thousands_separators', ()))
+        fetch = config.get('fetch', {})
+        self.rate = fetch.get('rate')
+        self.burst = fetch.get('burst')
+        # Motifs dont le premier groupe capture la valeur d'un champ dans le HTML brut,
+        # compilés une fois pour du texte et pour des octets
+        scan = config.get('scan', {})
+        self.scan = {field: tuple(scan[field]) for field in FIELDS if scan.get(field)}
+        self.scan_validation_rate = float(scan.get('validation_rate', 0.05))
+        # Sélecteur de prix que reproduit le motif du prix: seul sélecteur personnalisé lisible directement
+        self.scan_price_selector = scan.get('price_selector')
+        self._scan_patterns = {
+            (field, binary): tuple(re.compile(pattern.encode('utf-8') if binary else pattern) for pattern in patterns)
+            for field, patterns in self.scan.items()
+            for binary in (False, True)
+        }
+
+    def scan_patterns(self, field, binary=False):
+        """Motifs compilés d'un champ, pour du texte ou des octets bruts."""
+        return self._scan_patterns.get((field, binary), ())
+
+    def __repr__(self):
+        return f"SiteProfile({self.name!r})"
+
+
+class SiteRegistry:
+    """Profils de sites indexés par suffixe d'hôte et par label, chargés une fois depuis un fichier JSON."""
+
+    def __init__(self, profiles):
+        self._profiles = {}
+        self._by_suffix = {}
+        self._by_label = {}
+        self._by_host = {}
+        for profile in profiles:
+            self._profiles[profile.name] = profile
+            for domain in profile.domains:
+                self._by_suffix.setdefault(domain, profile)
+            for label in profile.labels:
+                self._by_label.setdefault(label, profile)
+        if GENERIC not in self._profiles:
+            self._profiles[GENERIC] = SiteProfile(GENERIC, {})
+
+    @classmethod
+    def from_file(cls, path=SITES_FILE):
+        """Charge le registre depuis un fichier JSON {nom du site: configuration}."""
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        profiles = []
+        for name, site_config in config.items():
+            try:
+                profiles.append(SiteProfile(name, site_config))
+            except (AttributeError, TypeError, ValueError, re.error) as e:
+                logger.error(f"Configuration invalide pour le site {name} dans {path}: {e}")
+        logger.debug(f"{len(profiles)} sites chargés depuis {path}")
+        return cls(profiles)
+
+    def names(self):
+        """Noms des sites du registre."""
+        return tuple(self._profiles)
+
+    def profiles(self):
+        return tuple(self._profiles.values())
+
+    def get(self, name):
+        """Profil d'un site par son nom (profil générique si inconnu)."""
+        return self._profiles.get(name) or self._profiles[GENERIC]
+
+    def for_host(self, host):
+        """Profil du site servant un hôte ('www.amazon.fr', éventuellement avec un port)."""
+        host = host.split(':')[0].lower()
+        profile = self._by_host.get(host)
+        if profile is None:
+            profile = self._lookup(host)
+            self._by_host[host] = profile
+        return profile
+
+    def for_url(self, url):
+        """Profil du site d'une URL, déterminé par son hôte uniquement."""
+        return self.for_host(urlsplit(url).netloc)
+
+    def _lookup(self, host):
+        labels = host.split('.')
+        for index in range(len(labels)):
+            profile = self._by_suffix.get('.'.join(labels[index:]))
+            if profile is not None:
+                return profile
+        for label in labels:
+            profile = self._by_label.get(label)
+            if profile is not None:
+                return profile
+        return self._profiles[GENERIC]
+
+
+# Registre partagé, chargé à l'import
+site_registry = SiteRegistry.from_file()
@@ -0,0 +1,190 @@
+"""
+Extraction rapide des données produit structurées (JSON-LD, microdata, OpenGraph).
+De nombreux sites e-commerce décrivent leurs produits avec des blocs application/ld+json
+(schema.org Product/Offer), des attributs itemprop ou des balises meta og:price:amount.
+Ce module les retrouve par simple recherche de texte et json.loads, sans construire le DOM.
+"""
+import json
+import logging
+import re
+
+logger = logging.getLogger('structured_data')
+
+_LD_JSON_RE = re.compile(
+    r'<script[^>]*type\s*=\s*["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL,
+)
+_META_RE = re.compile(r'<meta\b[^>]*>', re.IGNORECASE)
+_ITEMPROP_RE = re.compile(r'<[a-z][^>]*\bitemprop\s*=\s*["\']?(price|priceCurrency|availability|name|image)\b[^>]*>', re.IGNORECASE)
+_ATTR_RE = re.compile(r'([\w:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+
+CURRENCY_SYMBOLS = {'EUR': '€', 'USD': '$', 'GBP': '£', 'JPY': '¥'}
+
+# Disponibilités schema.org, traduites comme sur les pages des sites
+AVAILABILITY_LABELS = {
+    'instock': 'En stock',
+    'instoreonly': 'En magasin uniquement',
+    'onlineonly': 'En stock',
+    'limitedavailability': 'Stock limité',
+    'preorder': 'Précommande',
+    'presale': 'Précommande',
+    'backorder': 'En réapprovisionnement',
+    'outofstock': 'Rupture de stock',
+    'soldout': 'Rupture de stock',
+    'discontinued': 'Produit arrêté',
+}
+
+
+def _attributes(tag):
+    """Retourne les attributs d'une balise HTML sous forme de dictionnaire (noms en minuscules)."""
+    attrs = {}
+    for match in _ATTR_RE.finditer(tag):
+        value = next((v for v in match.group(2, 3, 4) if v is not None), '')
+        attrs[match.group(1).lower()] = value
+    return attrs
+
+
+def _iter_json_objects(data):
+    """Parcourt récursivement les objets d'un document JSON-LD (@graph, listes, offres imbriquées)."""
+    if isinstance(data, list):
+        for item in data:
+            yield from _iter_json_objects(item)
+    elif isinstance(data, dict):
+        yield data
+        for key in ('@graph', 'mainEntity', 'itemOffered'):
+            if key in data:
+                yield from _iter_json_objects(data[key])
+
+
+def _has_type(obj, name):
+    types = obj.get('@type')
+    if isinstance(types, str):
+        types = [types]
+    return any(isinstance(t, str) and t.split('/')[-1].lower() == name.lower() for t in types or [])
+
+
+def _first(value):
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _availability_label(value):
+    if not value:
+        return None
+    key = str(value).rstrip('/').split('/')[-1].lower()
+    return AVAILABILITY_LABELS.get(key, str(value).rstrip('/').split('/')[-1])
+
+
+def _image_url(value):
+    value = _first(value)
+    if isinstance(value, dict):
+        value = value.get('url') or value.get('contentUrl')
+    return value if isinstance(value, str) and value else None
+
+
+def _from_json_ld(html_content):
+    """Cherche un Product avec une offre dans les blocs JSON-LD."""
+    if 'ld+json' not in html_content:
+        return None
+    for block in _LD_JSON_RE.findall(html_content):
+        try:
+            data = json.loads(block.strip())
+        except ValueError:
+            continue
+        for obj in _iter_json_objects(data):
+            if not _has_type(obj, 'Product'):
+                continue
+            for offer in _iter_json_objects(obj.get('offers')):
+                price = offer.get('price', offer.get('lowPrice'))
+                if price is None and isinstance(offer.get('priceSpecification'), dict):
+                    price = offer['priceSpecification'].get('price')
+                if price in (None, ''):
+                    continue
+                return {
+                    'price': price,
+                    'currency': offer.get('priceCurrency'),
+                    'availability': _availability_label(offer.get('availability')),
+                    'title': obj.get('name'),
+                    'image_url': _image_url(obj.get('image')),
+                }
+    return None
+
+
+def _from_meta(html_content):
+    """Cherche le prix dans les balises meta OpenGraph/product et les attributs itemprop."""
+    values = {}
+    if 'price' not in html_content:
+        return None
+    for tag in _META_RE.findall(html_content):
+        attrs = _attributes(tag)
+        name = (attrs.get('property') or attrs.get('name') or attrs.get('itemprop') or '').lower()
+        content = attrs.get('content')
+        if content is None:
+            continue
+        if name in ('og:price:amount', 'product:price:amount', 'price'):
+            values.setdefault('price', content)
+        elif name in ('og:price:currency', 'product:price:currency', 'pricecurrency'):
+            values.setdefault('currency', content)
+        elif name in ('og:title', 'name'):
+            values.setdefault('title', content)
+        elif name in ('og:image', 'image'):
+            values.setdefault('image_url', content)
+        elif name in ('product:availability', 'og:availability', 'availability'):
+            values.setdefault('availability', _availability_label(content))
+    for match in _ITEMPROP_RE.finditer(html_content):
+        attrs = _attributes(match.group(0))
+        prop = match.group(1).lower()
+        value = attrs.get('content') or (attrs.get('href') if prop == 'availability' else None)
+        if prop == 'image':
+            value = attrs.get('content') or attrs.get('src')
+        if not value:
+            continue
+        if prop == 'price':
+            values.setdefault('price', value)
+        elif prop == 'pricecurrency':
+            values.setdefault('currency', value)
+        elif prop == 'availability':
+            values.setdefault('availability', _availability_label(value))
+        elif prop == 'name':
+            values.setdefault('title', value)
+        elif prop == 'image':
+            values.setdefault('image_url', value)
+    return values if values.get('price') else None
+
+
+def extract_structured_data(html_content):
+    """
+    Extrait prix, devise, disponibilité, titre et image des données structurées de la page.
+
+    Args:
+        html_content (str): Contenu HTML de la page
+
+    Returns:
+        dict: Champs price_text, numeric_price, currency, title, availability, image_url,
+              ou None si aucune donnée de prix structurée n'a été trouvée
+    """
+    if not html_content:
+        return None
+    data = _from_json_ld(html_content) or _from_meta(html_content)
+    if not data:
+        return None
+
+    amount = str(data['price']).strip().replace('\xa0', '').replace(' ', '')
+    try:
+        numeric_price = float(amount.replace(',', '.'))
+    except ValueError:
+        logger.debug(f"Prix structuré non numérique: {amount}")
+        return None
+
+    code = (data.get('currency') or '').strip().upper()
+    currency = CURRENCY_SYMBOLS.get(code, code or 'Unknown')
+    price_text = f"{amount} {currency}" if currency != 'Unknown' else amount
+    return {
+        'price_text': price_text,
+        'numeric_price': numeric_price,
+        'currency': currency,
+        'title': (data.get('title') or '').strip() or None,
+        'availability': data.get('availability'),
+        'image_url': data.get('image_url'),
+    }
@@ -0,0 +1,193 @@
+"""
+Cache des gabarits de pages produit.
+Les pages d'un même marchand partagent le plus souvent un même gabarit: les champs se
+trouvent au même endroit de l'arbre. template_fingerprint résume la structure d'une page
+(ensemble de ses identifiants d'éléments stables) et TemplateCache associe chaque empreinte
+connue aux sélecteurs et aux chemins de nœuds qui ont fourni les champs. Une page dont le
+gabarit est connu va directement à ces nœuds (FieldExtractor.locate) quand le HTML brut
+garantit qu'un parcours complet retiendrait les mêmes; les autres champs, et les pages de
+gabarit inconnu, sont cherchés par un parcours du document.
+Le gain de temps d'extraction est mesuré et rapporté par site.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from scripts.cache import CACHE_DIR, FileLock, PageCache
+
+logger = logging.getLogger('templates')
+
+# Identifiants d'éléments sans chiffres: les identifiants numérotés changent d'une page à l'autre.
+# Le motif commence par un littéral pour être cherché rapidement; l'espace qui précède
+# l'attribut est vérifié à part.
+_ID_RE = re.compile(r'id=["\']([A-Za-z_-]+)["\']')
+
+# Nombre de gabarits conservés par site (les plus anciens sont oubliés)
+MAX_TEMPLATES_PER_SITE = 100
+
+
+def template_fingerprint(html_content, css_selector=None, scoped=False):
+    """
+    Empreinte du gabarit d'une page: hachage de l'ensemble trié de ses identifiants d'éléments
+    sans chiffres. Le sélecteur de prix personnalisé en fait partie, car il ajoute un champ,
+    ainsi que l'analyse restreinte aux conteneurs du site, qui change les chemins des nœuds.
+    """
+    ids = sorted({match.group(1) for match in _ID_RE.finditer(html_content)
+                  if html_content[match.start() - 1:match.start()].isspace()})
+    digest = hashlib.sha1('|'.join(ids).encode('utf-8'))
+    if css_selector:
+        digest.update(f"\n{css_selector}".encode('utf-8'))
+    if scoped:
+        digest.update(b"\nscoped")
+    return digest.hexdigest()[:16]
+
+
+def _empty_stats():
+    return {'known': 0, 'unknown': 0, 'mismatch': 0, 'known_ms': 0.0, 'search_ms': 0.0}
+
+
+class TemplateCache:
+    """
+    Gabarits {site: {empreinte: {champ: [sélecteur, chemin] ou None}}} et statistiques
+    d'utilisation par site, persistés en JSON et fusionnés avec le fichier sous verrou.
+    """
+
+    FILE_NAME = 'templates.json'
+
+    def __init__(self, cache_dir=CACHE_DIR, flush_interval=60):
+        """
+        Args:
+            cache_dir (str): Répertoire du cache
+            flush_interval (float): Délai maximal entre deux enregistrements sur disque, en secondes
+        """
+        self.path = os.path.join(cache_dir, self.FILE_NAME)
+        self.lock_path = os.path.join(cache_dir, PageCache.LOCKS_NAME, 'templates.lock')
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        data = self._read()
+        self._templates = data['templates']
+        self._stats = data['stats']
+        self._learned = {}
+        self._pending_stats = {}
+        self._last_flush = time.monotonic()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                return {'templates': data.get('templates', {}), 'stats': data.get('stats', {})}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cache des gabarits illisible, il sera reconstruit: {e}")
+        return {'templates': {}, 'stats': {}}
+
+    def get(self, site, fingerprint):
+        """Chemins des champs pour un gabarit connu, ou None."""
+        entry = self._templates.get(site, {}).get(fingerprint)
+        return entry['fields'] if entry else None
+
+    def learn(self, site, fingerprint, fields):
+        """Mémorise (ou remplace) les chemins des champs d'un gabarit."""
+        entry = {'fields': fields, 'learned_at': time.time()}
+        with self._lock:
+            self._templates.setdefault(site, {})[fingerprint] = entry
+            self._learned.setdefault(site, {})[fingerprint] = entry
+
+    def record(self, site, template):
+        """
+        Enregistre l'usage du gabarit lors d'une analyse (infos 'template' de parse_page):
+        gabarit connu, inconnu ou ne correspondant plus, et durée d'extraction.
+        Les chemins appris dans un processus d'analyse sont mémorisés ici.
+        """
+        if template.get('fields') is not None:
+            self.learn(site, template['key'], template['fields'])
+        with self._lock:
+            for stats in (self._stats.setdefault(site, _empty_stats()),
+                          self._pending_stats.setdefault(site, _empty_stats())):
+                stats[template['state']] += 1
+                stats['known_ms' if template['state'] == 'known' else 'search_ms'] += template['extract_ms']
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    @staticmethod
+    def _merge(data, learned, pending_stats):
+        for site, entries in learned.items():
+            templates = data['templates'].setdefault(site, {})
+            templates.update(entries)
+            if len(templates) > MAX_TEMPLATES_PER_SITE:
+                oldest = sorted(templates, key=lambda key: templates[key]['learned_at'])
+                for key in oldest[:len(templates) - MAX_TEMPLATES_PER_SITE]:
+                    del templates[key]
+        for site, delta in pending_stats.items():
+            stats = data['stats'].setdefault(site, _empty_stats())
+            for name, value in delta.items():
+                stats[name] += value
+        return data
+
+    def flush(self):
+        """Ajoute les gabarits appris et les statistiques de ce processus au fichier sur disque."""
+        with self._lock:
+            learned, self._learned = self._learned, {}
+            pending_stats, self._pending_stats = self._pending_stats, {}
+            self._last_flush = time.monotonic()
+        if not learned and not pending_stats:
+            return
+        try:
+            with FileLock(self.lock_path, timeout=10, stale_after=30):
+                data = self._merge(self._read(), learned, pending_stats)
+                tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Impossible d'enregistrer le cache des gabarits: {e}")
+            with self._lock:
+                self._merge({'templates': self._learned, 'stats': self._pending_stats}, learned, pending_stats)
+            return
+        with self._lock:
+            # Reprend les gabarits des autres processus, plus ceux appris pendant l'écriture
+            data = self._merge(data, self._learned, {})
+            self._templates = data['templates']
+            self._stats = self._merge(data, {}, self._pending_stats)['stats']
+
+    def report(self):
+        """
+        Utilisation des gabarits et temps d'extraction économisé, par site.
+
+        Returns:
+            dict: {site: templates, known, unknown, mismatch, hit_rate, known_ms et search_ms
+                  (durées moyennes d'extraction), saved_ms (gain estimé sur les pages au gabarit connu)}
+        """
+        with self._lock:
+            stats = json.loads(json.dumps(self._stats))
+            counts = {site: len(entries) for site, entries in self._templates.items()}
+        report = {}
+        for site, values in stats.items():
+            searched = values['unknown'] + values['mismatch']
+            pages = values['known'] + searched
+            known_ms = values['known_ms'] / values['known'] if values['known'] else None
+            search_ms = values['search_ms'] / searched if searched else None
+            saved = (search_ms - known_ms) * values['known'] if known_ms is not None and search_ms is not None else None
+            report[site] = {
+                'templates': counts.get(site, 0),
+                'known': values['known'],
+                'unknown': values['unknown'],
+                'mismatch': values['mismatch'],
+                'hit_rate': round(values['known'] / pages, 3) if pages else None,
+                'known_ms': round(known_ms, 2) if known_ms is not None else None,
+                'search_ms': round(search_ms, 2) if search_ms is not None else None,
+                'saved_ms': round(saved, 1) if saved is not None else None,
+            }
+        return report
+
+
+# Gabarits partagés par l'analyseur et le scraper
+template_cache = TemplateCache()
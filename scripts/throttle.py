@@ -0,0 +1,400 @@
+"""
+État partagé par domaine pour réguler le scraping.
+DomainBackoff mémorise les blocages (captcha, 403, 429) par domaine et impose une
+pause exponentielle avant de solliciter à nouveau ce domaine, pour tous les workers
+d'une même exécution. DomainRateLimiter limite le débit de requêtes de chaque domaine
+avec un seau à jetons (débit et rafale configurables). AdaptiveConcurrency ajuste le
+nombre de requêtes simultanées par domaine selon les réponses (AIMD). CircuitBreaker
+coupe un domaine en panne après plusieurs échecs consécutifs.
+"""
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger('scraper_throttle')
+
+
+class DomainBackoff:
+    """
+    Pause exponentielle par domaine après un blocage.
+    Chaque blocage consécutif double la durée de pause (jusqu'à max_delay);
+    une réponse réussie remet le compteur à zéro.
+    """
+
+    def __init__(self, base_delay=60, max_delay=1800):
+        """
+        Args:
+            base_delay (float): Pause après le premier blocage, en secondes
+            max_delay (float): Pause maximale, en secondes
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def record_block(self, domain, reason=None, delay=None):
+        """
+        Enregistre un blocage et retourne la durée de pause imposée au domaine.
+
+        Args:
+            domain (str): Domaine concerné
+            reason (str): Motif du blocage, pour les logs
+            delay (float): Pause imposée par le serveur (Retry-After), prioritaire si plus longue
+        """
+        with self._lock:
+            count, _ = self._state.get(domain, (0, 0))
+            count += 1
+            pause = min(self.base_delay * 2 ** (count - 1), self.max_delay)
+            if delay is not None:
+                pause = max(pause, delay)
+            self._state[domain] = (count, time.time() + pause)
+        logger.warning(f"Blocage détecté sur {domain} ({reason or 'inconnu'}): pause de {pause:.0f} secondes")
+        return pause
+
+    def record_success(self, domain):
+        """Remet à zéro l'état de blocage d'un domaine."""
+        with self._lock:
+            self._state.pop(domain, None)
+
+    def remaining(self, domain):
+        """Retourne le nombre de secondes avant de pouvoir solliciter à nouveau le domaine (0 si libre)."""
+        with self._lock:
+            state = self._state.get(domain)
+        if state is None:
+            return 0
+        return max(0.0, state[1] - time.time())
+
+    def snapshot(self):
+        """Retourne l'état courant: {domaine: {'blocks': n, 'remaining': secondes}}."""
+        now = time.time()
+        with self._lock:
+            return {
+                domain: {'blocks': count, 'remaining': max(0.0, until - now)}
+                for domain, (count, until) in self._state.items()
+            }
+
+
+class TokenBucket:
+    """Seau à jetons: rate jetons par seconde, au plus burst jetons accumulés."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_in(self):
+        """Secondes avant qu'un jeton soit disponible (0 s'il y en a un), sans le consommer."""
+        self._refill(time.monotonic())
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def try_acquire(self):
+        """Consomme un jeton s'il y en a un; sinon retourne le temps d'attente nécessaire."""
+        wait = self.ready_in()
+        if wait == 0:
+            self.tokens -= 1
+        return wait
+
+
+class DomainRateLimiter:
+    """
+    Limiteur de débit par domaine (seau à jetons), partagé par tous les workers.
+    Chaque domaine a son propre seau: les domaines différents avancent en parallèle
+    tandis que chacun reste sous sa limite. Les limites spécifiques sont indexées par
+    suffixe d'hôte ('amazon.fr' s'applique à 'www.amazon.fr').
+    """
+
+    def __init__(self, rate=0.5, burst=2, limits=None):
+        """
+        Args:
+            rate (float): Requêtes par seconde autorisées par défaut pour un domaine
+            burst (int): Nombre de requêtes pouvant partir d'affilée par défaut
+            limits (dict): Limites spécifiques {suffixe d'hôte: (rate, burst)}
+        """
+        self.rate = rate
+        self.burst = burst
+        self.limits = dict(limits or {})
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def set_limit(self, host_suffix, rate, burst):
+        """Définit la limite d'un domaine (ou d'un suffixe d'hôte)."""
+        with self._lock:
+            self.limits[host_suffix] = (rate, burst)
+            for domain in [d for d in self._buckets if d == host_suffix or d.endswith('.' + host_suffix)]:
+                del self._buckets[domain]
+
+    def limit_for(self, domain):
+        """Retourne (rate, burst) applicables à un domaine."""
+        host = domain.split(':')[0]
+        labels = host.split('.')
+        for index in range(len(labels)):
+            suffix = '.'.join(labels[index:])
+            if suffix in self.limits:
+                return self.limits[suffix]
+        return self.rate, self.burst
+
+    def _bucket(self, domain):
+        bucket = self._buckets.get(domain)
+        if bucket is None:
+            rate, burst = self.limit_for(domain)
+            bucket = TokenBucket(rate, burst)
+            self._buckets[domain] = bucket
+        return bucket
+
+    def ready_in(self, domain):
+        """Secondes avant qu'une requête vers domain soit autorisée, sans réserver de créneau."""
+        with self._lock:
+            return self._bucket(domain).ready_in()
+
+    def acquire(self, domain):
+        """
+        Attend un créneau de requête pour domain.
+
+        Returns:
+            float: Temps d'attente en secondes
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                wait = self._bucket(domain).try_acquire()
+            if wait == 0:
+                if waited:
+                    logger.debug(f"Limitation de débit {domain}: {waited:.2f} s d'attente")
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+
+# Statuts HTTP signalant qu'un site est surchargé ou nous limite
+CONGESTION_STATUSES = frozenset((403, 429, 503))
+
+# Attente maximale acceptée depuis un en-tête Retry-After, en secondes
+MAX_RETRY_AFTER = 3600
+
+
+def parse_retry_after(value):
+    """
+    Convertit un en-tête Retry-After (secondes ou date HTTP) en nombre de secondes.
+
+    Returns:
+        float: Attente demandée (bornée à MAX_RETRY_AFTER), ou None si l'en-tête est absent ou invalide
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        seconds = float(value)
+    else:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError, OverflowError):
+            return None
+    return min(max(0.0, seconds), MAX_RETRY_AFTER)
+
+
+class AdaptiveConcurrency:
+    """
+    Contrôle adaptatif du nombre de requêtes simultanées par domaine (AIMD).
+    La limite d'un domaine augmente d'environ une requête par fenêtre de réponses réussies
+    (augmentation additive) et est divisée par deux sur 429/503/403 (diminution
+    multiplicative). Un Retry-After suspend le domaine pour tous les workers.
+    """
+
+    def __init__(self, initial=2, minimum=1, maximum=8, decrease_factor=0.5, decrease_interval=2.0):
+        """
+        Args:
+            initial (float): Limite de départ d'un domaine
+            minimum (float): Limite plancher
+            maximum (float): Limite plafond
+            decrease_factor (float): Facteur appliqué à la limite sur un signal de surcharge
+            decrease_interval (float): Délai minimal entre deux diminutions, en secondes, pour
+                qu'une rafale de 429 simultanés ne compte que pour un seul signal
+        """
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.decrease_interval = decrease_interval
+        self._state = {}
+        self._condition = threading.Condition()
+
+    def _domain_state(self, domain):
+        state = self._state.get(domain)
+        if state is None:
+            state = {'limit': float(self.initial), 'in_flight': 0, 'paused_until': 0.0, 'decreased_at': 0.0}
+            self._state[domain] = state
+        return state
+
+    def limit(self, domain):
+        """Nombre de requêtes simultanées actuellement autorisées pour un domaine."""
+        with self._condition:
+            return max(1, int(self._domain_state(domain)['limit']))
+
+    def pause_remaining(self, domain):
+        """Secondes restantes de la suspension demandée par Retry-After (0 si aucune)."""
+        with self._condition:
+            return max(0.0, self._domain_state(domain)['paused_until'] - time.time())
+
+    def acquire(self, domain):
+        """Attend qu'une requête vers domain soit autorisée et la compte comme en cours."""
+        with self._condition:
+            state = self._domain_state(domain)
+            while True:
+                pause = state['paused_until'] - time.time()
+                if pause <= 0 and state['in_flight'] < max(1, int(state['limit'])):
+                    state['in_flight'] += 1
+                    return
+                self._condition.wait(timeout=pause if pause > 0 else None)
+
+    def release(self, domain):
+        """Libère la place d'une requête terminée."""
+        with self._condition:
+            state = self._domain_state(domain)
+            state['in_flight'] = max(0, state['in_flight'] - 1)
+            self._condition.notify_all()
+
+    def record_success(self, domain):
+        """Augmentation additive: +1 sur la limite après une fenêtre complète de succès."""
+        with self._condition:
+            state = self._domain_state(domain)
+            state['limit'] = min(self.maximum, state['limit'] + 1.0 / state['limit'])
+            self._condition.notify_all()
+
+    def record_congestion(self, domain, retry_after=None):
+        """
+        Diminution multiplicative après un 429/503/403, et suspension du domaine
+        pendant retry_after secondes si le serveur l'a demandé.
+        """
+        now = time.time()
+        with self._condition:
+            state = self._domain_state(domain)
+            if now - state['decreased_at'] >= self.decrease_interval:
+                state['limit'] = max(self.minimum, state['limit'] * self.decrease_factor)
+                state['decreased_at'] = now
+            if retry_after:
+                state['paused_until'] = max(state['paused_until'], now + retry_after)
+            limit = state['limit']
+        logger.warning(f"Surcharge signalée par {domain}: limite ramenée à {max(1, int(limit))} requête(s) simultanée(s)"
+                       + (f", reprise dans {retry_after:.0f} s" if retry_after else ""))
+
+    def snapshot(self):
+        """Retourne l'état courant: {domaine: {'limit': n, 'in_flight': n, 'paused': secondes}}."""
+        now = time.time()
+        with self._condition:
+            return {
+                domain: {
+                    'limit': round(state['limit'], 2),
+                    'in_flight': state['in_flight'],
+                    'paused': max(0.0, state['paused_until'] - now),
+                }
+                for domain, state in self._state.items()
+            }
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur par domaine.
+    Après failure_threshold échecs consécutifs (erreurs réseau, 5xx, blocages), le circuit
+    s'ouvre: les requêtes vers le domaine échouent immédiatement pendant cooldown secondes.
+    Le circuit passe ensuite en semi-ouvert et laisse passer une seule requête de test:
+    un succès le referme, un échec le rouvre pour un nouveau délai.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, cooldown=300, probe_timeout=120):
+        """
+        Args:
+            failure_threshold (int): Échecs consécutifs avant ouverture du circuit
+            cooldown (float): Durée d'ouverture avant la requête de test, en secondes
+            probe_timeout (float): Délai après lequel une requête de test sans réponse est abandonnée
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.probe_timeout = probe_timeout
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def _domain_state(self, domain):
+        state = self._state.get(domain)
+        if state is None:
+            state = {'state': self.CLOSED, 'failures': 0, 'opened_at': 0.0,
+                     'probe_started': None, 'rejected': 0, 'trips': 0}
+            self._state[domain] = state
+        return state
+
+    def allow(self, domain):
+        """
+        Indique si une requête vers domain peut partir. En semi-ouvert, seule la
+        requête de test est autorisée; l'appelant doit en rapporter le résultat.
+        """
+        now = time.time()
+        with self._lock:
+            state = self._domain_state(domain)
+            if state['state'] == self.CLOSED:
+                return True
+            if state['state'] == self.OPEN and now - state['opened_at'] >= self.cooldown:
+                state['state'] = self.HALF_OPEN
+                state['probe_started'] = None
+            if state['state'] == self.HALF_OPEN:
+                probe = state['probe_started']
+                if probe is None or now - probe >= self.probe_timeout:
+                    state['probe_started'] = now
+                    logger.info(f"Circuit semi-ouvert pour {domain}: requête de test")
+                    return True
+            state['rejected'] += 1
+            return False
+
+    def record_success(self, domain):
+        """Referme le circuit et remet le compteur d'échecs à zéro."""
+        with self._lock:
+            state = self._domain_state(domain)
+            if state['state'] != self.CLOSED:
+                logger.info(f"Circuit refermé pour {domain}")
+            state.update(state=self.CLOSED, failures=0, probe_started=None)
+
+    def record_failure(self, domain, reason=None):
+        """Compte un échec; ouvre le circuit au seuil ou si la requête de test échoue."""
+        with self._lock:
+            state = self._domain_state(domain)
+            state['failures'] += 1
+            if state['state'] == self.HALF_OPEN or (
+                    state['state'] == self.CLOSED and state['failures'] >= self.failure_threshold):
+                state.update(state=self.OPEN, opened_at=time.time(), probe_started=None)
+                state['trips'] += 1
+                logger.warning(f"Circuit ouvert pour {domain} après {state['failures']} échecs consécutifs "
+                               f"({reason or 'inconnu'}): reprise dans {self.cooldown:.0f} secondes")
+
+    def state(self, domain):
+        """Retourne l'état du circuit d'un domaine ('closed', 'open' ou 'half_open')."""
+        with self._lock:
+            return self._domain_state(domain)['state']
+
+    def snapshot(self):
+        """
+        Retourne l'état courant: {domaine: {'state', 'failures', 'rejected', 'trips', 'remaining'}},
+        'rejected' comptant les requêtes refusées et 'trips' le nombre d'ouvertures.
+        """
+        now = time.time()
+        with self._lock:
+            return {
+                domain: {
+                    'state': state['state'],
+                    'failures': state['failures'],
+                    'rejected': state['rejected'],
+                    'trips': state['trips'],
+                    'remaining': (max(0.0, state['opened_at'] + self.cooldown - now)
+                                  if state['state'] == self.OPEN else 0.0),
+                }
+                for domain, state in self._state.items()
+            }
@@ -0,0 +1,84 @@
+"""
+Normalisation des URL de produits.
+Une même fiche produit peut être enregistrée sous plusieurs URL (paramètres de suivi,
+slug différent, fragment). canonical_url les ramène à une forme unique, utilisée pour
+la clé du cache, l'identifiant des produits et la déduplication des récupérations.
+"""
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from scripts.sites import site_registry
+
+# Paramètres de suivi (campagnes, identifiants de clic) retirés des URL de tous les sites:
+# ils n'ont aucun effet sur le contenu de la page
+TRACKING_PARAMS = frozenset((
+    'gclid', 'gclsrc', 'dclid', 'gbraid', 'wbraid', 'fbclid', 'msclkid', 'yclid',
+    'ttclid', 'twclid', 'igshid', 'mc_cid', 'mc_eid', 'awc', 'cm_mmc', 'xtor',
+))
+TRACKING_PREFIXES = ('utm_', 'at_')
+
+# Paramètres propres à Amazon (affiliation, recherche, variante déjà portée par l'ASIN),
+# retirés seulement des URL Amazon: ailleurs, un paramètre du même nom peut changer la page
+AMAZON_PARAMS = frozenset((
+    'ref', 'ref_', 'tag', 'linkcode', 'camp', 'creative', 'creativeasin', 'ascsubtag',
+    '_encoding', 'content-id', 'psc', 'th', 'qid', 'sr', 'keywords', 'crid', 'sprefix',
+    'dib', 'dib_tag', 'dchild', 'smid', 'spla', 'sp_csd', 'oref', 'origin', 'esl-k', 'sourceid',
+))
+AMAZON_PREFIXES = ('pd_rd_', 'pf_rd_', 'ref_', 'sp_')
+
+# Identifiant de produit Amazon (ASIN) dans les différentes formes d'URL
+_AMAZON_ASIN_RE = re.compile(r'/(?:dp|gp/product|gp/aw/d|exec/obidos/asin|o/asin)/([A-Z0-9]{10})(?:[/?]|$)', re.IGNORECASE)
+
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def _canonical_query(query, is_ignored=_is_tracking_param):
+    """Paramètres de la requête triés, sans ceux que is_ignored désigne."""
+    params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if not is_ignored(k)]
+    return urlencode(sorted(params))
+
+
+def _is_amazon_param(name):
+    lowered = name.lower()
+    return lowered in AMAZON_PARAMS or lowered.startswith(AMAZON_PREFIXES) or _is_tracking_param(name)
+
+
+def _canonical_amazon(scheme, host, path, query):
+    """
+    Réduit une fiche Amazon à /dp/ASIN: le slug et les paramètres ne changent pas la page.
+    Les autres pages Amazon perdent leurs paramètres de suivi et d'affiliation.
+    """
+    match = _AMAZON_ASIN_RE.search(path)
+    if match is None:
+        return urlunsplit((scheme, host, path, _canonical_query(query, _is_amazon_param), ''))
+    return urlunsplit((scheme, host, f"/dp/{match.group(1).upper()}", '', ''))
+
+
+# Règles spécifiques, appliquées à la place de la règle générique aux sites dont le profil
+# (data/sites.json) les désigne par leur nom dans 'canonical'
+CANONICAL_RULES = {
+    'amazon_asin': _canonical_amazon,
+}
+
+
+def canonical_url(url):
+    """
+    Retourne la forme canonique d'une URL de produit: schéma et hôte en minuscules,
+    sans fragment ni paramètres de suivi, paramètres restants triés. Les sites connus
+    sont réduits à leur identifiant de produit (Amazon: /dp/ASIN).
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = parts.netloc.lower()
+    path = parts.path or '/'
+
+    rule = CANONICAL_RULES.get(site_registry.for_host(host).canonical)
+    if rule is not None:
+        canonical = rule(scheme, host, path, parts.query)
+        if canonical is not None:
+            return canonical
+
+    return urlunsplit((scheme, host, path, _canonical_query(parts.query), ''))
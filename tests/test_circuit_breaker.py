@@ -0,0 +1,45 @@
+"""Disjoncteur par domaine: issue de la requête de test en semi-ouvert."""
+import pytest
+
+from scripts import scraper
+from scripts.replay import FixtureStore, ReplayServer
+from scripts.throttle import CircuitBreaker, DomainBackoff
+
+URL = 'http://shop.example.com/produit/1'
+DOMAIN = 'shop.example.com'
+
+BLOCK_PAGE = (b'<html><head><title>Robot Check</title></head><body>'
+              b'<form action="/errors/validateCaptcha"></form></body></html>')
+
+
+@pytest.fixture
+def replay_server(tmp_path, monkeypatch):
+    store = FixtureStore(str(tmp_path / 'fixtures'))
+    store.save(URL, 200, {'Content-Type': 'text/html; charset=utf-8'}, BLOCK_PAGE)
+    server = ReplayServer(store).start()
+    for name in ('HTTP_PROXY', 'http_proxy'):
+        monkeypatch.setenv(name, server.address)
+    monkeypatch.delenv('NO_PROXY', raising=False)
+    monkeypatch.delenv('no_proxy', raising=False)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def half_open_breaker(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+    breaker.record_failure(DOMAIN, 'panne simulée')
+    monkeypatch.setattr(scraper, 'circuit_breaker', breaker)
+    monkeypatch.setattr(scraper, 'domain_backoff', DomainBackoff())
+    return breaker
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_probe_answered_by_block_page_reopens_circuit(replay_server, half_open_breaker, stream):
+    result = scraper._fetch_live(URL, None, retries=1, delay=0, use_cache=False, stream=stream)
+
+    assert result['status'] == 'blocked'
+    assert replay_server.stats['served'] == 1
+    # La requête de test a échoué: le circuit se rouvre au lieu de rester semi-ouvert
+    assert half_open_breaker.state(DOMAIN) == CircuitBreaker.OPEN
+    assert half_open_breaker.snapshot()[DOMAIN]['trips'] == 2
@@ -0,0 +1,46 @@
+"""Parité des backends d'analyse html.parser et lxml."""
+import pytest
+
+pytest.importorskip('lxml')
+pytest.importorskip('cssselect')
+
+from scripts.ecommerce_parser import EcommerceParser
+from scripts.html_backends import make_document
+
+URL = 'https://www.amazon.fr/dp/B000000000'
+
+XHTML_PAGE = '''<?xml version="1.0" encoding="iso-8859-1"?>
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" "http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head><title>Théière en fonte</title></head>
+<body>
+<div id="ppd">
+<span id="productTitle">Théière en fonte</span>
+<span class="a-price"><span class="a-offscreen">12,00 €</span></span>
+<div id="availability"><span>En stock</span></div>
+<img id="landingImage" src="/images/theiere.jpg" />
+</div>
+</body>
+</html>
+'''
+
+
+def _without_timings(result):
+    return {key: value for key, value in result.items() if key != 'template'}
+
+
+@pytest.mark.parametrize('scoped', [True, False])
+def test_xhtml_page_gives_identical_results(scoped):
+    results = {
+        backend: EcommerceParser.parse_dom(XHTML_PAGE, URL, backend=backend, scoped=scoped)
+        for backend in ('html.parser', 'lxml')
+    }
+    assert results['lxml']['price_text'] == '12,00 €'
+    assert results['lxml']['title'] == 'Théière en fonte'
+    assert _without_timings(results['lxml']) == _without_timings(results['html.parser'])
+
+
+def test_lxml_parses_text_with_xml_declaration():
+    document = make_document(XHTML_PAGE, 'lxml')
+    assert document.root is not None
+    assert document.select_one('#productTitle').get_text(strip=True) == 'Théière en fonte'